@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Banco de pruebas reproducible. Sirve una serie sintética desde un servidor
+HTTP local (mismo HTML del que depende el código: número en
+<b class="text-xs md:text-base">, imágenes .webp con carga diferida y enlace
+<a><i class="...chevron-right"></i></a>) y mide descargar,
+eliminar_duplicados_img y convertir_folder_a_cbz de principio a fin:
+
+    python benchmark.py --capitulos 10 --paginas 20 --kib 300 --latencia-ms 50
+    python benchmark.py --etapas duplicados,cbz --repeticiones 5 --salida base.json
+    python benchmark.py --etapas duplicados,cbz --comparar base.json
+
+Cada repetición empieza en una carpeta vacía (caché fría). Si no se mide
+'descargar', las carpetas de capítulos se generan directamente, así que
+duplicados y CBZ se pueden medir sin Playwright.
+"""
+import argparse
+import http.server
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import nucleo
+
+ETAPAS = ("descargar", "duplicados", "cbz")
+SERIE = "Serie_Benchmark"
+PREFIJO_CBZ = "Benchmark"
+
+
+class SitioSintetico:
+    """
+    Serie falsa generada en memoria. Cada capítulo tiene 'paginas' imágenes
+    de 'kib' KiB (bytes pseudoaleatorios, iguales en cada ejecución con la
+    misma 'semilla'), una página de créditos idéntica en todos los capítulos
+    (la encuentra el paso de duplicados), un banner pequeño (lo descarta
+    TAMANIO_MIN) y una portada y un avatar que el extractor debe ignorar.
+    Cada respuesta se retrasa 'latencia_ms' y 'bytes_servidos' cuenta los
+    cuerpos enviados.
+    """
+
+    KIB_BANNER = 8
+
+    def __init__(self, capitulos, paginas, kib, latencia_ms=0, semilla=0):
+        self.capitulos = capitulos
+        self.paginas = paginas
+        self.kib = kib
+        self.latencia = latencia_ms / 1000
+        self.semilla = semilla
+        self.bytes_servidos = 0
+        self._lock = threading.Lock()
+        self._servidor = None
+
+    def _bytes(self, clave, kib):
+        n = kib * 1024
+        return random.Random(f"{self.semilla}-{clave}").getrandbits(8 * n).to_bytes(n, "little")
+
+    def imagen(self, capitulo, pagina):
+        """Contenido de /img/<capitulo>/<pagina>.webp ('creditos' y 'banner' son páginas especiales)."""
+        if pagina == "creditos":
+            return self._bytes("creditos", self.kib)
+        if pagina == "banner":
+            return self._bytes(f"banner-{capitulo}", self.KIB_BANNER)
+        return self._bytes(f"{capitulo}-{pagina}", self.kib)
+
+    def paginas_de(self, capitulo):
+        """Nombres de las imágenes del capítulo en orden de lectura."""
+        return [str(p) for p in range(1, self.paginas + 1)] + ["creditos", "banner"]
+
+    def html(self, capitulo):
+        imagenes = "\n".join(
+            f'<img class="lazy" data-src="/img/{capitulo}/{p}.webp" alt="">' for p in self.paginas_de(capitulo)
+        )
+        siguiente = ""
+        if capitulo < self.capitulos:
+            siguiente = f'<a href="/serie/capitulo-{capitulo + 1}"><i class="fa-solid fa-chevron-right"></i></a>'
+        return f"""<!doctype html>
+<html><head><meta charset="utf-8"><title>Capítulo {capitulo}</title>
+<style>img {{ display: block; width: 100%; min-height: 1200px; }}</style></head>
+<body>
+<header><img src="/cover.webp" alt="portada"><b class="text-xs md:text-base">{capitulo}</b></header>
+<main>
+{imagenes}
+</main>
+<nav>{siguiente}</nav>
+<footer><img src="/discus/avatar.webp" alt=""></footer>
+<script>
+const obs = new IntersectionObserver((entradas) => {{
+    for (const e of entradas) {{
+        if (e.isIntersecting) {{ e.target.src = e.target.dataset.src; obs.unobserve(e.target); }}
+    }}
+}}, {{rootMargin: "200px"}});
+document.querySelectorAll("img.lazy").forEach(i => obs.observe(i));
+</script>
+</body></html>
+"""
+
+    def _respuesta(self, ruta):
+        """(tipo, cuerpo) para 'ruta', o None si no existe."""
+        partes = ruta.strip("/").split("/")
+        if len(partes) == 2 and partes[0] == "serie" and partes[1].startswith("capitulo-"):
+            capitulo = int(partes[1].split("-", 1)[1])
+            if 1 <= capitulo <= self.capitulos:
+                return "text/html; charset=utf-8", self.html(capitulo).encode("utf-8")
+        elif len(partes) == 3 and partes[0] == "img" and partes[2].endswith(".webp"):
+            capitulo, pagina = int(partes[1]), partes[2][:-len(".webp")]
+            if 1 <= capitulo <= self.capitulos and pagina in self.paginas_de(capitulo):
+                return "image/webp", self.imagen(capitulo, pagina)
+        elif ruta in ("/cover.webp", "/discus/avatar.webp"):
+            return "image/webp", self._bytes(ruta, 60)
+        return None
+
+    def arrancar(self):
+        """Arranca el servidor en un puerto libre y devuelve la URL del primer capítulo."""
+        sitio = self
+
+        class Manejador(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _responder(self, con_cuerpo):
+                time.sleep(sitio.latencia)
+                respuesta = sitio._respuesta(self.path.split("?", 1)[0])
+                if respuesta is None:
+                    self.send_error(404)
+                    return
+                tipo, cuerpo = respuesta
+                self.send_response(200)
+                self.send_header("Content-Type", tipo)
+                self.send_header("Content-Length", str(len(cuerpo)))
+                self.end_headers()
+                if con_cuerpo:
+                    self.wfile.write(cuerpo)
+                    with sitio._lock:
+                        sitio.bytes_servidos += len(cuerpo)
+
+            def do_HEAD(self):
+                self._responder(False)
+
+            def do_GET(self):
+                self._responder(True)
+
+        self._servidor = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+        self._servidor.daemon_threads = True
+        threading.Thread(target=self._servidor.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self._servidor.server_port}/serie/capitulo-1"
+
+    def detener(self):
+        if self._servidor:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+
+    def poblar_carpetas(self, serie_dir):
+        """Escribe los capítulos como los dejaría 'descargar' (sin el banner pequeño), sin pasar por HTTP."""
+        capitulos_dir = os.path.join(serie_dir, "Capitulos_Carpetas")
+        for capitulo in range(1, self.capitulos + 1):
+            carpeta = os.path.join(capitulos_dir, str(capitulo))
+            os.makedirs(carpeta, exist_ok=True)
+            for idx, pagina in enumerate(self.paginas_de(capitulo)[:-1], start=1):
+                with open(os.path.join(carpeta, f"imagen_{idx:03d}.webp"), "wb") as f:
+                    f.write(self.imagen(capitulo, pagina))
+
+    def totales(self):
+        """(imágenes, bytes) que deberían acabar en las carpetas de capítulos."""
+        por_capitulo = self.paginas + 1
+        return self.capitulos * por_capitulo, self.capitulos * por_capitulo * self.kib * 1024
+
+
+def _contar_imagenes(serie_dir):
+    capitulos_dir = os.path.join(serie_dir, "Capitulos_Carpetas")
+    total = 0
+    for raiz, _, archivos in os.walk(capitulos_dir):
+        total += sum(1 for a in archivos if os.path.splitext(a)[1].lower() in nucleo.EXT_VALIDAS)
+    return total
+
+
+def _repeticion(sitio, url, etapas, motor, log):
+    """Ejecuta las etapas una vez en una carpeta vacía. Devuelve ({etapa: segundos}, datos extra)."""
+    tiempos, extra = {}, {}
+    anterior = os.getcwd()
+    trabajo = tempfile.mkdtemp(prefix="benchmark_")
+    try:
+        os.chdir(trabajo)
+        serie_dir = os.path.join(trabajo, SERIE)
+        if "descargar" in etapas:
+            servidos = sitio.bytes_servidos
+            inicio = time.perf_counter()
+            nucleo.descargar(SERIE, url, str(sitio.capitulos), motor)
+            tiempos["descargar"] = time.perf_counter() - inicio
+            extra["imagenes_descargadas"] = _contar_imagenes(serie_dir)
+            extra["mib_servidos_descarga"] = round((sitio.bytes_servidos - servidos) / (1024 * 1024), 2)
+            metricas = os.path.join(serie_dir, "metricas")
+            if os.path.isdir(metricas):
+                for nombre in sorted(os.listdir(metricas)):
+                    if nombre.startswith("corrida_") and nombre.endswith(".json"):
+                        with open(os.path.join(metricas, nombre), encoding="utf-8") as f:
+                            extra["metricas_descarga"] = json.load(f)
+        else:
+            sitio.poblar_carpetas(serie_dir)
+
+        if "duplicados" in etapas:
+            inicio = time.perf_counter()
+            nucleo.eliminar_duplicados_img(SERIE)
+            tiempos["duplicados"] = time.perf_counter() - inicio
+            extra["imagenes_tras_duplicados"] = _contar_imagenes(serie_dir)
+
+        if "cbz" in etapas:
+            inicio = time.perf_counter()
+            nucleo.convertir_folder_a_cbz(SERIE, PREFIJO_CBZ)
+            tiempos["cbz"] = time.perf_counter() - inicio
+            comics_dir = os.path.join(serie_dir, "comics_archivos")
+            extra["cbz_creados"] = sum(1 for a in os.listdir(comics_dir) if a.endswith(".cbz"))
+    finally:
+        os.chdir(anterior)
+        log.flush()
+        shutil.rmtree(trabajo, ignore_errors=True)
+    return tiempos, extra
+
+
+def ejecutar(args):
+    etapas = [e for e in ETAPAS if e in args.etapas.split(",")]
+    if "descargar" in etapas:
+        try:
+            import playwright.sync_api  # noqa: F401
+        except ImportError:
+            raise SystemExit("La etapa 'descargar' necesita Playwright (pip install playwright; "
+                             "playwright install firefox). Usa --etapas duplicados,cbz para medir sin él.")
+
+    nucleo.PAUSA_ENTRE_CAPITULOS = args.pausa
+    nucleo.CAPTURAR_IMAGENES_NAVEGADOR = not args.sin_captura
+    nucleo.FORMATO_METRICAS = "json"
+    log = open(args.log, "a", encoding="utf-8") if args.log else open(os.devnull, "w")
+    nucleo.fijar_log(lambda texto: print(texto, file=log))
+
+    sitio = SitioSintetico(args.capitulos, args.paginas, args.kib, args.latencia_ms, args.semilla)
+    url = sitio.arrancar()
+    imagenes, total_bytes = sitio.totales()
+    muestras = {etapa: [] for etapa in etapas}
+    extras = []
+    try:
+        for n in range(1, args.repeticiones + 1):
+            tiempos, extra = _repeticion(sitio, url, etapas, args.motor, log)
+            for etapa, segundos in tiempos.items():
+                muestras[etapa].append(segundos)
+            extras.append(extra)
+            print(f"Repetición {n}/{args.repeticiones}: "
+                  + ", ".join(f"{etapa} {segundos:.2f} s" for etapa, segundos in tiempos.items()))
+    finally:
+        sitio.detener()
+        log.close()
+
+    resultados = {}
+    for etapa, valores in muestras.items():
+        mediana = statistics.median(valores)
+        resultados[etapa] = {
+            "segundos": [round(v, 4) for v in valores],
+            "mediana": round(mediana, 4),
+            "minimo": round(min(valores), 4),
+            "capitulos_por_s": round(args.capitulos / mediana, 3),
+            "imagenes_por_s": round(imagenes / mediana, 2),
+            "mib_por_s": round(total_bytes / (1024 * 1024) / mediana, 2),
+        }
+    return {
+        "fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "parametros": {k: getattr(args, k) for k in ("capitulos", "paginas", "kib", "latencia_ms", "semilla",
+                                                      "repeticiones", "pausa", "motor", "sin_captura")},
+        "entorno": {"python": platform.python_version(), "sistema": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "resultados": resultados,
+        "ultima_repeticion": extras[-1] if extras else {},
+    }
+
+
+def mostrar(informe, base=None):
+    """Imprime la tabla de resultados y, con 'base', la variación de la mediana respecto a ella."""
+    p = informe["parametros"]
+    print(f"\n{p['capitulos']} capítulos x {p['paginas']} páginas de {p['kib']} KiB, "
+          f"latencia {p['latencia_ms']} ms, {p['repeticiones']} repeticiones")
+    print(f"{'etapa':<12}{'mediana s':>11}{'mín s':>9}{'cap/s':>9}{'img/s':>10}{'MiB/s':>9}{'vs base':>10}")
+    for etapa, r in informe["resultados"].items():
+        comparacion = ""
+        anterior = (base or {}).get("resultados", {}).get(etapa)
+        if anterior:
+            comparacion = f"{100 * (r['mediana'] - anterior['mediana']) / anterior['mediana']:+.1f}%"
+        print(f"{etapa:<12}{r['mediana']:>11.3f}{r['minimo']:>9.3f}{r['capitulos_por_s']:>9.2f}"
+              f"{r['imagenes_por_s']:>10.1f}{r['mib_por_s']:>9.1f}{comparacion:>10}")
+    servidos = informe.get("ultima_repeticion", {}).get("mib_servidos_descarga")
+    if servidos is not None:
+        print(f"descargar transfirió {servidos:.1f} MiB desde el sitio (última repetición)")
+    if base and base.get("parametros") != informe["parametros"]:
+        print("Aviso: la base se midió con otros parámetros; la comparación no es directa.")
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(prog="benchmark.py", description="Mide el rendimiento contra una serie sintética local.")
+    parser.add_argument("--capitulos", type=int, default=5)
+    parser.add_argument("--paginas", type=int, default=20, help="páginas por capítulo (más créditos y banner)")
+    parser.add_argument("--kib", type=int, default=200, help="tamaño de cada página en KiB")
+    parser.add_argument("--latencia-ms", type=int, default=0, help="retraso añadido a cada respuesta HTTP")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--etapas", default=",".join(ETAPAS), help="etapas a medir, separadas por comas")
+    parser.add_argument("--motor", choices=sorted(nucleo.MOTORES_DESCARGA), default=None)
+    parser.add_argument("--pausa", type=float, default=0.0,
+                        help=f"pausa entre capítulos (s); la aplicación usa {nucleo.PAUSA_ENTRE_CAPITULOS}")
+    parser.add_argument("--sin-captura", action="store_true",
+                        help="baja todas las imágenes por HTTP en vez de tomarlas del navegador")
+    parser.add_argument("--log", help="archivo donde guardar el log de la aplicación (por defecto se descarta)")
+    parser.add_argument("--salida", help="guarda el informe en este JSON")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior con el que comparar")
+    return parser
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    base = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+    informe = ejecutar(args)
+    mostrar(informe, base)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(informe, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Línea de comandos (sin ventana) para las mismas tareas que main.py:
+
+    python cli.py descargar "Mi Serie" https://.../capitulo-1 --final 120
+    python cli.py reanudar "Mi Serie"
+    python cli.py actualizar "Mi Serie"
+    python cli.py duplicados "Mi Serie" --perceptual
+    python cli.py procesar "Mi Serie" --formato webp --calidad 85 --alto 2000
+    python cli.py cbz "Mi Serie" "Mi Serie"
+    python cli.py eliminar "Mi Serie"
+    python cli.py lote trabajos.txt --paralelo 3 --navegadores 2 --kib-por-segundo 4096
+
+El archivo de 'lote' tiene un trabajo por línea con la misma sintaxis (sin el
+"python cli.py"); las líneas vacías y las que empiezan por '#' se ignoran. Los
+trabajos de una misma serie se ejecutan en orden y las series distintas a la
+vez, hasta '--paralelo'. Entre todos no pasan de los límites globales de
+navegadores, conexiones y ancho de banda.
+"""
+import argparse
+import shlex
+import sys
+
+import nucleo
+
+
+def _descargar(args, progreso=None):
+    salida = "cbz" if args.cbz else "carpetas"
+    return nucleo.descargar(args.serie, args.url, args.final, args.motor, salida=salida, prefix=args.cbz or "",
+                            progreso=progreso)
+
+
+def _reanudar(args, progreso=None):
+    return nucleo.reanudar(args.serie, args.motor, progreso=progreso)
+
+
+def _actualizar(args, progreso=None):
+    return nucleo.actualizar_serie(args.serie, args.url, args.motor,
+                                   salida="cbz" if args.cbz else None, prefix=args.cbz, progreso=progreso)
+
+
+def _duplicados(args, progreso=None):
+    return nucleo.eliminar_duplicados_img(args.serie, args.perceptual, args.umbral)
+
+
+def _procesar(args, progreso=None):
+    formato = None if args.formato == "original" else args.formato
+    return nucleo.procesar_imagenes(args.serie, formato, args.calidad, args.alto or None, progreso=progreso)
+
+
+def _cbz(args, progreso=None):
+    return nucleo.convertir_folder_a_cbz(args.serie, args.prefijo, progreso=progreso)
+
+
+def _eliminar(args, progreso=None):
+    return nucleo.eliminar_archivos_al_finalizar(args.serie)
+
+
+def crear_parser(con_lote=True):
+    """Parser de la línea de comandos. Sin 'con_lote' sirve para leer las líneas de un lote."""
+    parser = argparse.ArgumentParser(prog="cli.py", description="Descarga y procesa series sin interfaz gráfica.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    def motor(p):
+        p.add_argument("--motor", choices=sorted(nucleo.MOTORES_DESCARGA),
+                       help=f"motor HTTP (por defecto {nucleo.MOTOR_DESCARGAS})")
+
+    p = sub.add_parser("descargar", help="descarga capítulos desde una URL")
+    p.add_argument("serie")
+    p.add_argument("url", help="URL del primer capítulo a descargar")
+    p.add_argument("--final", default="", help="número del último capítulo (sin él, hasta el final)")
+    p.add_argument("--cbz", metavar="PREFIJO", help="escribe cada capítulo directamente en un CBZ con este prefijo")
+    motor(p)
+    p.set_defaults(func=_descargar)
+
+    p = sub.add_parser("reanudar", help="reanuda la última descarga de la serie")
+    p.add_argument("serie")
+    motor(p)
+    p.set_defaults(func=_reanudar)
+
+    p = sub.add_parser("actualizar", help="baja solo los capítulos nuevos")
+    p.add_argument("serie")
+    p.add_argument("--url", help="capítulo desde el que empezar si la serie no tiene diario")
+    p.add_argument("--cbz", metavar="PREFIJO", help="escribe los capítulos nuevos directamente en CBZ")
+    motor(p)
+    p.set_defaults(func=_actualizar)
+
+    p = sub.add_parser("duplicados", help="elimina imágenes repetidas entre capítulos")
+    p.add_argument("serie")
+    p.add_argument("--perceptual", action="store_true", help="incluye casi duplicados (necesita Pillow y numpy)")
+    p.add_argument("--umbral", type=int, default=nucleo.UMBRAL_PERCEPTUAL,
+                   help=f"distancia máxima entre hashes perceptuales (por defecto {nucleo.UMBRAL_PERCEPTUAL})")
+    p.set_defaults(func=_duplicados)
+
+    p = sub.add_parser("procesar", help="recodifica las imágenes y normaliza el alto de las páginas (necesita Pillow)")
+    p.add_argument("serie")
+    p.add_argument("--formato", choices=["webp", "jpeg", "png", "original"],
+                   default=nucleo.FORMATO_PROCESADO or "original",
+                   help=f"formato de salida (por defecto {nucleo.FORMATO_PROCESADO or 'original'})")
+    p.add_argument("--calidad", type=int, default=nucleo.CALIDAD_PROCESADO,
+                   help=f"calidad de WebP/JPEG (por defecto {nucleo.CALIDAD_PROCESADO})")
+    p.add_argument("--alto", type=int, default=nucleo.ALTO_PAGINA or 0,
+                   help=f"alto de página en px; 0 para no partir ni juntar (por defecto {nucleo.ALTO_PAGINA or 0})")
+    p.set_defaults(func=_procesar)
+
+    p = sub.add_parser("cbz", help="convierte las carpetas de capítulos en CBZ")
+    p.add_argument("serie")
+    p.add_argument("prefijo")
+    p.set_defaults(func=_cbz)
+
+    p = sub.add_parser("eliminar", help="borra las carpetas de capítulos y los CBZ")
+    p.add_argument("serie")
+    p.set_defaults(func=_eliminar)
+
+    if con_lote:
+        p = sub.add_parser("lote", help="ejecuta los trabajos de un archivo")
+        p.add_argument("archivo")
+        p.add_argument("--paralelo", type=int, default=1, help="series que se procesan a la vez (por defecto 1)")
+        p.add_argument("--navegadores", type=int,
+                       help=f"navegadores abiertos a la vez entre todas las series "
+                            f"(por defecto {nucleo.MAX_NAVEGADORES})")
+        p.add_argument("--conexiones", type=int,
+                       help=f"conexiones a la vez entre todas las series, navegadores incluidos "
+                            f"(por defecto {nucleo.MAX_CONEXIONES_TOTALES})")
+        p.add_argument("--kib-por-segundo", type=int,
+                       help="ancho de banda total para imágenes, también las que carga el navegador "
+                            "(por defecto sin límite)")
+        p.set_defaults(func=None)
+    return parser
+
+
+def leer_lote(ruta):
+    """Lee un archivo de lote y devuelve sus trabajos agrupados por serie, en orden: {serie: [args]}."""
+    parser = crear_parser(con_lote=False)
+    series = {}
+    with open(ruta, encoding="utf-8") as f:
+        for numero, linea in enumerate(f, start=1):
+            linea = linea.strip()
+            if not linea or linea.startswith("#"):
+                continue
+            try:
+                args = parser.parse_args(shlex.split(linea))
+            except (SystemExit, ValueError):
+                raise SystemExit(f"{ruta}:{numero}: trabajo no válido: {linea}")
+            series.setdefault(args.serie, []).append(args)
+    return series
+
+
+def ejecutar_lote(ruta, paralelo=1):
+    """Ejecuta un archivo de lote con hasta 'paralelo' series a la vez. Devuelve el número de series con errores."""
+    series = leer_lote(ruta)
+    nucleo.append_log(f"[LOTE] {sum(map(len, series.values()))} trabajos de {len(series)} series, "
+                      f"{paralelo} a la vez.")
+    planificador = nucleo.Planificador(paralelo)
+    planificador.agregar_varios([(serie, args.comando, lambda progreso, args=args: args.func(args, progreso))
+                                 for serie, trabajos in series.items() for args in trabajos])
+    planificador.esperar()
+    fallidas = planificador.series_con_errores()
+    if fallidas:
+        nucleo.append_log(f"[LOTE] Series con errores: {', '.join(fallidas)}")
+    nucleo.append_log("[LOTE] Lote finalizado.")
+    return len(fallidas)
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    if args.comando == "lote":
+        if args.navegadores or args.conexiones or args.kib_por_segundo:
+            nucleo.configurar_limites(args.navegadores, args.conexiones,
+                                      args.kib_por_segundo and args.kib_por_segundo * 1024)
+        return 1 if ejecutar_lote(args.archivo, args.paralelo) else 0
+    return 1 if args.func(args) is False else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
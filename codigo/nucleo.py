@@ -0,0 +1,3382 @@
+#!/usr/bin/env python3
+# Lógica de descarga, duplicados y CBZ, sin interfaz gráfica. La usan la
+# ventana Tkinter (main.py) y la línea de comandos (cli.py). Playwright,
+# requests y httpx solo se importan cuando una función los necesita.
+import threading
+import bisect
+import contextlib
+import json
+import math
+import random
+import os
+import time
+import urllib.parse
+import hashlib
+import shutil
+import concurrent.futures
+import queue
+import sqlite3
+import tempfile
+import zipfile
+
+#################################
+# Funciones auxiliares para logs
+#################################
+
+def shorten_path(path, base_dir, max_len=80):
+    """
+    Retorna una versión 'corta' del path, relativa a base_dir si es posible.
+    Si aun así es muy largo, se trunca a max_len.
+    """
+    try:
+        rel = os.path.relpath(path, base_dir)
+    except ValueError:
+        # Si no se puede relajar, usamos tal cual
+        rel = path
+    # Truncar si excede max_len
+    if len(rel) > max_len:
+        return rel[:max_len] + "..."
+    return rel
+
+def shorten_url(url, max_len=60):
+    """
+    Si la URL supera max_len, se trunca para no saturar el log.
+    Útil para imágenes. No para la URL del capítulo.
+    """
+    if len(url) > max_len:
+        return url[:max_len] + "..."
+    return url
+
+
+#################################
+# SECCIÓN: Log
+#################################
+
+_lock_log = threading.Lock()
+
+
+def _log_consola(text):
+    with _lock_log:
+        print(text, flush=True)
+
+
+_destino_log = _log_consola
+
+
+def fijar_log(funcion):
+    """Cambia a dónde va append_log (por defecto, la consola). La ventana Tkinter pone su cuadro de salida."""
+    global _destino_log
+    _destino_log = funcion
+
+
+def append_log(text):
+    _destino_log(text)
+
+
+##############################
+# SECCIÓN: Configuración
+##############################
+
+# Extensiones de imagen que se tratan como páginas de capítulo
+EXT_VALIDAS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tiff'}
+# Tamaño mínimo (bytes) de una imagen para guardarla (filtra iconos/banners)
+TAMANIO_MIN = 40 * 1024
+# Reiniciar Firefox cada N capítulos para que la memoria no crezca sin límite
+MAX_CAPITULOS_POR_NAVEGADOR = 50
+# Capítulos ya recorridos que pueden esperar en cola a ser descargados
+MAX_CAPITULOS_EN_COLA = 2
+# Descargas de imágenes simultáneas al empezar; el control AIMD las ajusta
+# según la latencia y los errores entre CONCURRENCIA_MIN y CONCURRENCIA_MAX
+DESCARGAS_SIMULTANEAS = 8
+CONCURRENCIA_MIN = 2
+CONCURRENCIA_MAX = 16
+# Latencia media mayor que FACTOR_LATENCIA veces la mejor vista: se trata como congestión
+FACTOR_LATENCIA = 3
+# Timeouts (s) de conexión y de lectura (sin recibir nada) de cada petición de imagen
+TIMEOUT_CONEXION = 10
+TIMEOUT_LECTURA = 30
+# Reintentos por imagen ante timeouts, errores de red, 429 y 5xx, con espera
+# exponencial desde ESPERA_REINTENTO_BASE hasta ESPERA_REINTENTO_MAX segundos
+REINTENTOS_IMAGEN = 4
+ESPERA_REINTENTO_BASE = 0.5
+ESPERA_REINTENTO_MAX = 30
+# Pausa (segundos) antes de abrir el siguiente capítulo
+PAUSA_ENTRE_CAPITULOS = 2
+# Límites globales, compartidos por todos los trabajos que corren a la vez:
+# navegadores abiertos, conexiones (navegadores incluidos) y bytes/s de imágenes,
+# también las que carga Firefox (None = sin límite)
+MAX_NAVEGADORES = 2
+MAX_CONEXIONES_TOTALES = 32
+MAX_BYTES_POR_SEGUNDO = None
+# Conexiones de cada Firefox abierto; se descuentan de MAX_CONEXIONES_TOTALES
+CONEXIONES_NAVEGADOR = 6
+# Trabajos (descargas, duplicados, CBZ...) que el planificador ejecuta a la vez
+TRABAJOS_SIMULTANEOS = 2
+# Motor HTTP para las imágenes: "hilos" (requests) o "async" (httpx)
+MOTOR_DESCARGAS = "hilos"
+# Conexiones simultáneas como máximo contra un mismo host (techo del control AIMD)
+CONEXIONES_POR_HOST = 16
+# Tamaño de bloque al leer las respuestas HTTP
+TAMANIO_BLOQUE = 256 * 1024
+# HTTP/2 en el motor "async" (requiere httpx[http2])
+USAR_HTTP2 = False
+# Hilos del motor "async" para lo que toca el disco (caché, carpetas, CBZ, diario)
+HILOS_DISCO_ASYNC = 4
+# Esperas máximas (ms) para el número de capítulo y para la carga de imágenes
+ESPERA_MAX_NUMERO_MS = 5000
+ESPERA_MAX_IMAGENES_MS = 30000
+# Tiempo sin cambios (ms) para dar por estable el conjunto de imágenes
+QUIETUD_IMAGENES_MS = 500
+# Enviar un HEAD antes de cada GET para descartar imágenes pequeñas (modo antiguo).
+# Sin HEAD se usa el Content-Length de la propia respuesta GET.
+COMPROBAR_CON_HEAD = False
+# Guardar en la caché las imágenes que el navegador ya bajó al recorrer el
+# capítulo, en lugar de pedirlas otra vez; el motor HTTP solo baja las que faltan
+CAPTURAR_IMAGENES_NAVEGADOR = True
+# Bytes iniciales que se comparan antes de calcular el hash completo (duplicados)
+BYTES_HASH_PARCIAL = 64 * 1024
+# Hilos para calcular hashes (hashlib libera el GIL con bloques grandes)
+HILOS_HASH = min(32, (os.cpu_count() or 1) * 2)
+# Distancia de Hamming máxima (de 64 bits) para considerar dos imágenes casi iguales
+UMBRAL_PERCEPTUAL = 6
+# Imágenes por lote al calcular hashes perceptuales
+LOTE_PERCEPTUAL = 64
+# Procesado opcional de imágenes antes del CBZ (necesita Pillow): formato de
+# salida ("webp", "jpeg", "png" o None para conservar el de cada imagen) y calidad
+FORMATO_PROCESADO = "webp"
+CALIDAD_PROCESADO = 85
+# Alto (px) de página al partir tiras largas y juntar trozos cortos; None para no tocarlas
+ALTO_PAGINA = 2000
+# Procesos que recodifican capítulos a la vez
+PROCESOS_IMAGENES = os.cpu_count() or 1
+# Procesos que empaquetan capítulos en CBZ a la vez
+PROCESOS_CBZ = os.cpu_count() or 1
+# Compresión por formato dentro del CBZ: los ya comprimidos se guardan tal cual
+COMPRESION_CBZ = {
+    '.webp': zipfile.ZIP_STORED,
+    '.jpg': zipfile.ZIP_STORED,
+    '.jpeg': zipfile.ZIP_STORED,
+    '.png': zipfile.ZIP_STORED,
+    '.bmp': zipfile.ZIP_DEFLATED,
+    '.tiff': zipfile.ZIP_DEFLATED,
+}
+# Tamaño de bloque al copiar imágenes dentro del CBZ
+BLOQUE_CBZ = 1024 * 1024
+# Tamaño máximo de cache_images; al superarlo se borran las imágenes usadas hace más tiempo
+MAX_BYTES_CACHE = 2 * 1024 ** 3
+# Resumen de métricas de cada descarga en Nombre_de_la_serie/metricas/:
+# "json", "prometheus", "ambos" o None para no guardarlo
+FORMATO_METRICAS = "json"
+# Además, una línea JSON por capítulo terminado (metricas/traza_<fecha>.jsonl)
+TRAZA_POR_CAPITULO = False
+
+
+##############################
+# SECCIÓN: Métricas
+##############################
+
+class Metricas:
+    """
+    Contadores e histogramas de duración (en segundos) de una corrida; se
+    pueden usar desde varios hilos. El resumen se guarda como JSON, para
+    comparar corridas entre versiones, o como archivo de texto de Prometheus
+    (textfile collector de node_exporter).
+    """
+
+    # Límites superiores (segundos) de las cubetas de los histogramas
+    CUBETAS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.contadores = {}
+        self.histogramas = {}
+
+    def sumar(self, nombre, valor=1):
+        with self._lock:
+            self.contadores[nombre] = self.contadores.get(nombre, 0) + valor
+
+    def observar(self, nombre, segundos):
+        cubeta = bisect.bisect_left(self.CUBETAS, segundos)
+        with self._lock:
+            h = self.histogramas.get(nombre)
+            if h is None:
+                h = self.histogramas[nombre] = {"cuentas": [0] * (len(self.CUBETAS) + 1), "n": 0,
+                                                "suma": 0.0, "max": 0.0}
+            h["cuentas"][cubeta] += 1
+            h["n"] += 1
+            h["suma"] += segundos
+            h["max"] = max(h["max"], segundos)
+
+    @contextlib.contextmanager
+    def medir(self, nombre):
+        """Mide el bloque 'with' y lo anota en el histograma 'nombre'."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(nombre, time.perf_counter() - inicio)
+
+    def _percentil(self, h, q):
+        # Aproximado por el límite de la cubeta (nunca mayor que el máximo visto)
+        acumulado = 0
+        for limite, cuenta in zip(self.CUBETAS + (h["max"],), h["cuentas"]):
+            acumulado += cuenta
+            if acumulado >= q * h["n"]:
+                return min(limite, h["max"])
+        return h["max"]
+
+    def como_dict(self):
+        with self._lock:
+            histogramas = {
+                nombre: {
+                    "n": h["n"],
+                    "suma": round(h["suma"], 6),
+                    "media": round(h["suma"] / h["n"], 6),
+                    "max": round(h["max"], 6),
+                    "p50": self._percentil(h, 0.5),
+                    "p90": self._percentil(h, 0.9),
+                    "p99": self._percentil(h, 0.99),
+                }
+                for nombre, h in sorted(self.histogramas.items())
+            }
+            return {"contadores": dict(sorted(self.contadores.items())), "histogramas": histogramas}
+
+    def guardar_json(self, ruta, **extra):
+        """Guarda el resumen (más los campos de 'extra') en 'ruta'."""
+        datos = dict(extra)
+        datos.update(self.como_dict())
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False, indent=2)
+
+    def guardar_prometheus(self, ruta, prefijo="descargar_manhua", **etiquetas):
+        """
+        Guarda contadores e histogramas en formato de texto de Prometheus. Se
+        escribe en un temporal y se renombra para que el collector nunca lea
+        un archivo a medias.
+        """
+        def _etiquetas(extra=None):
+            todas = dict(etiquetas, **(extra or {}))
+            if not todas:
+                return ""
+            valores = []
+            for clave, valor in todas.items():
+                valor = str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+                valores.append(f'{clave}="{valor}"')
+            return "{" + ",".join(valores) + "}"
+
+        lineas = []
+        with self._lock:
+            for nombre, valor in sorted(self.contadores.items()):
+                lineas.append(f"# TYPE {prefijo}_{nombre}_total counter")
+                lineas.append(f"{prefijo}_{nombre}_total{_etiquetas()} {valor}")
+            for nombre, h in sorted(self.histogramas.items()):
+                metrica = f"{prefijo}_{nombre}"
+                lineas.append(f"# TYPE {metrica} histogram")
+                acumulado = 0
+                for limite, cuenta in zip(self.CUBETAS, h["cuentas"]):
+                    acumulado += cuenta
+                    lineas.append(f"{metrica}_bucket{_etiquetas({'le': limite})} {acumulado}")
+                lineas.append(f"{metrica}_bucket{_etiquetas({'le': '+Inf'})} {h['n']}")
+                lineas.append(f"{metrica}_sum{_etiquetas()} {h['suma']:.6f}")
+                lineas.append(f"{metrica}_count{_etiquetas()} {h['n']}")
+        temporal = ruta + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.write("\n".join(lineas) + "\n")
+        os.replace(temporal, ruta)
+
+    def resumen(self, maximo=6):
+        """Texto con las etapas que más tiempo sumaron en la corrida."""
+        with self._lock:
+            etapas = sorted(self.histogramas.items(), key=lambda item: item[1]["suma"], reverse=True)[:maximo]
+            return ", ".join(
+                f"{nombre} {h['suma']:.1f} s (n={h['n']}, p90 {self._percentil(h, 0.9):.2f} s)"
+                for nombre, h in etapas
+            )
+
+
+##############################
+# SECCIÓN: Límites globales
+##############################
+
+def _despertar_avisos(avisos):
+    """
+    Despierta, desde cualquier hilo, las corrutinas que esperan en 'avisos'
+    [(bucle, future)] y vacía la lista. Requiere el lock que protege la lista.
+    """
+    for bucle, aviso in avisos:
+        try:
+            bucle.call_soon_threadsafe(_resolver_aviso, aviso)
+        except RuntimeError:
+            pass  # El bucle ya se cerró
+    avisos.clear()
+
+
+def _resolver_aviso(aviso):
+    if not aviso.done():
+        aviso.set_result(None)
+
+
+class SemaforoCompartido:
+    """
+    Semáforo que comparten hilos ('with' o acquire()) y corrutinas de
+    cualquier bucle asyncio (await adquirir_async()). Las corrutinas esperan
+    un aviso de release() en lugar de sondear ni bloquear su bucle.
+    """
+
+    def __init__(self, valor):
+        self._valor = valor
+        self._cond = threading.Condition()
+        self._avisos = []
+
+    def acquire(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._valor > 0)
+            self._valor -= 1
+
+    async def adquirir_async(self):
+        import asyncio
+        bucle = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self._valor > 0:
+                    self._valor -= 1
+                    return
+                aviso = bucle.create_future()
+                self._avisos.append((bucle, aviso))
+            await aviso
+
+    def release(self):
+        with self._cond:
+            self._valor += 1
+            self._cond.notify()
+            _despertar_avisos(self._avisos)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class CuboTokens:
+    """
+    Limita un caudal a 'tasa' bytes/s permitiendo ráfagas de hasta 'rafaga'
+    bytes. Quien recibe datos descuenta lo recibido y espera lo que indique
+    reservar(); al dejar de leer, TCP frena al servidor. Sin 'tasa' no limita.
+    """
+
+    def __init__(self, tasa=None, rafaga=None):
+        self.tasa = tasa
+        self.rafaga = rafaga or (tasa or 0)
+        self._tokens = self.rafaga
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self, n):
+        """Descuenta 'n' bytes y devuelve los segundos a esperar para no pasar de la tasa."""
+        if not self.tasa:
+            return 0.0
+        with self._lock:
+            ahora = time.monotonic()
+            self._tokens = min(self.rafaga, self._tokens + (ahora - self._ultimo) * self.tasa)
+            self._ultimo = ahora
+            self._tokens -= n
+            return max(0.0, -self._tokens / self.tasa)
+
+
+class LimitesGlobales:
+    """
+    Recursos que comparten todas las descargas del proceso: navegadores
+    abiertos a la vez, peticiones de imágenes en curso (sumando todos los
+    motores) y ancho de banda. Sin argumentos usa MAX_NAVEGADORES,
+    MAX_CONEXIONES_TOTALES y MAX_BYTES_POR_SEGUNDO.
+    Cada navegador tiene reservadas 'conexiones_navegador' conexiones (Firefox
+    no abre más) y los motores HTTP se reparten el resto; así el total no
+    pasa del límite (si da para una por navegador y una para los motores) y
+    nadie espera a un hueco que tiene otro.
+    """
+
+    def __init__(self, navegadores=None, conexiones=None, bytes_por_segundo=None):
+        self.max_navegadores = navegadores or MAX_NAVEGADORES
+        self.max_conexiones = conexiones or MAX_CONEXIONES_TOTALES
+        self.bytes_por_segundo = bytes_por_segundo or MAX_BYTES_POR_SEGUNDO
+        self.navegadores = threading.BoundedSemaphore(self.max_navegadores)
+        self.conexiones_navegador = max(1, min(CONEXIONES_NAVEGADOR,
+                                               self.max_conexiones // (self.max_navegadores + 1)))
+        self.conexiones_http = max(1, self.max_conexiones - self.max_navegadores * self.conexiones_navegador)
+        self.conexiones = SemaforoCompartido(self.conexiones_http)
+        self.ancho_banda = CuboTokens(self.bytes_por_segundo)
+
+    async def adquirir_conexion_async(self):
+        await self.conexiones.adquirir_async()
+
+    def resumen(self):
+        tasa = f"{self.bytes_por_segundo / (1024 * 1024):.1f} MiB/s" if self.bytes_por_segundo else "sin límite"
+        return (f"{self.max_navegadores} navegadores, {self.max_conexiones} conexiones "
+                f"({self.conexiones_navegador} por navegador), {tasa}")
+
+
+LIMITES = LimitesGlobales()
+
+
+def configurar_limites(navegadores=None, conexiones=None, bytes_por_segundo=None):
+    """
+    Cambia los límites globales (lo no indicado toma el valor de la
+    configuración). Debe llamarse sin trabajos en curso.
+    """
+    global LIMITES
+    LIMITES = LimitesGlobales(navegadores, conexiones, bytes_por_segundo)
+    append_log(f"[LOTE] Límites globales: {LIMITES.resumen()}")
+
+
+##############################
+# SECCIÓN: Planificador de trabajos
+##############################
+
+class Trabajo:
+    """
+    Una tarea del planificador. 'accion(progreso)' hace el trabajo y puede
+    llamar a 'progreso(texto)' para informar de su avance; si devuelve False
+    el trabajo cuenta como fallido.
+    'estado': "en cola", "en curso", "terminado", "error" u "omitido".
+    """
+
+    def __init__(self, numero, serie, descripcion, accion):
+        self.numero = numero
+        self.serie = serie
+        self.descripcion = descripcion
+        self.accion = accion
+        self.estado = "en cola"
+        self.progreso = ""
+        self.inicio = None
+        self.fin = None
+
+
+class Planificador:
+    """
+    Cola de trabajos (descargas, duplicados, CBZ...) de varias series que
+    ejecuta hasta 'simultaneos' a la vez (por defecto TRABAJOS_SIMULTANEOS).
+    Los trabajos de una misma serie van en orden y nunca a la vez; si uno
+    falla (su acción lanza una excepción o devuelve False, como hacen las
+    funciones de este módulo cuando no pueden completar el trabajo), se
+    omiten los que esa serie tenía en cola. Los recursos que
+    comparten (navegadores, conexiones, ancho de banda) los limita LIMITES.
+    'al_cambiar(trabajo)' se llama desde el hilo del trabajo cada vez que
+    cambia su estado o su progreso.
+    """
+
+    def __init__(self, simultaneos=None, al_cambiar=None):
+        self.simultaneos = max(1, simultaneos or TRABAJOS_SIMULTANEOS)
+        self.al_cambiar = al_cambiar
+        self.trabajos = []
+        self._cond = threading.Condition()
+        self._ocupadas = set()  # Series con un trabajo en curso
+        self._hilos = 0
+
+    def agregar(self, serie, descripcion, accion):
+        """Encola un trabajo y lo devuelve; empieza en cuanto haya hueco y su serie esté libre."""
+        return self.agregar_varios([(serie, descripcion, accion)])[0]
+
+    def agregar_varios(self, trabajos):
+        """
+        Encola de una vez [(serie, descripcion, accion)] y devuelve sus Trabajo.
+        Ninguno empieza antes de que estén todos en cola, así que si uno falla
+        enseguida los siguientes de su serie ya están y se omiten.
+        """
+        with self._cond:
+            nuevos = []
+            for serie, descripcion, accion in trabajos:
+                trabajo = Trabajo(len(self.trabajos) + 1, serie, descripcion, accion)
+                self.trabajos.append(trabajo)
+                nuevos.append(trabajo)
+            for _ in range(min(len(nuevos), self.simultaneos - self._hilos)):
+                self._hilos += 1
+                threading.Thread(target=self._trabajar, daemon=True).start()
+            self._cond.notify_all()
+        for trabajo in nuevos:
+            self._avisar(trabajo)
+        return nuevos
+
+    def esperar(self):
+        """Espera a que no quede ningún trabajo en cola ni en curso."""
+        with self._cond:
+            self._cond.wait_for(lambda: not any(t.estado in ("en cola", "en curso") for t in self.trabajos))
+
+    def _siguiente(self):
+        # Requiere el lock. El primero en cola de cada serie es el más antiguo.
+        for trabajo in self.trabajos:
+            if trabajo.estado == "en cola" and trabajo.serie not in self._ocupadas:
+                return trabajo
+        return None
+
+    def _trabajar(self):
+        while True:
+            with self._cond:
+                trabajo = self._siguiente()
+                while trabajo is None:
+                    if not any(t.estado == "en cola" for t in self.trabajos):
+                        self._hilos -= 1
+                        return
+                    self._cond.wait()
+                    trabajo = self._siguiente()
+                trabajo.estado = "en curso"
+                trabajo.inicio = time.time()
+                self._ocupadas.add(trabajo.serie)
+            append_log(f"[LOTE] #{trabajo.numero} {trabajo.serie}: {trabajo.descripcion} en curso.")
+            self._avisar(trabajo)
+
+            try:
+                if trabajo.accion(lambda texto, t=trabajo: self._progreso(t, texto)) is False:
+                    append_log(f"[LOTE] #{trabajo.numero} {trabajo.serie}: {trabajo.descripcion} falló "
+                               f"(ver el log).")
+                    estado = "error"
+                else:
+                    estado = "terminado"
+            except Exception as e:
+                append_log(f"[LOTE] #{trabajo.numero} {trabajo.serie}: {trabajo.descripcion} falló ({e}).")
+                estado = "error"
+
+            omitidos = []
+            with self._cond:
+                trabajo.estado = estado
+                trabajo.fin = time.time()
+                self._ocupadas.discard(trabajo.serie)
+                if estado == "error":
+                    for t in self.trabajos:
+                        if t.serie == trabajo.serie and t.estado == "en cola":
+                            t.estado = "omitido"
+                            omitidos.append(t)
+                self._cond.notify_all()
+            if omitidos:
+                append_log(f"[LOTE] {trabajo.serie}: se omiten sus {len(omitidos)} trabajos restantes.")
+            elif estado == "terminado":
+                append_log(f"[LOTE] #{trabajo.numero} {trabajo.serie}: {trabajo.descripcion} terminado "
+                           f"en {trabajo.fin - trabajo.inicio:.0f} s.")
+            for t in [trabajo] + omitidos:
+                self._avisar(t)
+
+    def _progreso(self, trabajo, texto):
+        trabajo.progreso = texto
+        self._avisar(trabajo)
+
+    def _avisar(self, trabajo):
+        if self.al_cambiar:
+            self.al_cambiar(trabajo)
+
+    def series_con_errores(self):
+        return sorted({t.serie for t in self.trabajos if t.estado == "error"})
+
+
+##############################
+# SECCIÓN: Gestor del navegador
+##############################
+
+def _es_url_imagen(url):
+    return os.path.splitext(urllib.parse.urlparse(url).path)[1].lower() in EXT_VALIDAS
+
+
+class GestorNavegador:
+    """
+    Mantiene un único Firefox (navegador + contexto + página) durante toda la
+    descarga, en lugar de lanzar uno nuevo por capítulo.
+    El navegador se reinicia solo si se cae o tras 'max_capitulos' capítulos.
+    Acumula el tiempo de arranque/cierre para poder medir el ahorro y anota
+    arranques, cierres y navegaciones en 'metricas'.
+    Con 'capturar', 'respuestas' guarda las respuestas de imágenes del último
+    capítulo abierto ({url: Response}) para poder leer sus cuerpos.
+    Cada navegador abierto ocupa un hueco de LIMITES.navegadores, no abre más
+    de LIMITES.conexiones_navegador conexiones y, si hay límite de ancho de
+    banda, las imágenes que carga también lo gastan (_medir_imagen).
+    """
+
+    def __init__(self, playwright, max_capitulos=MAX_CAPITULOS_POR_NAVEGADOR, metricas=None,
+                 capturar=CAPTURAR_IMAGENES_NAVEGADOR):
+        self._playwright = playwright
+        self.max_capitulos = max_capitulos
+        self.metricas = metricas or Metricas()
+        self.capturar = capturar
+        self.respuestas = {}
+        self._limites = None  # LimitesGlobales cuyo hueco ocupa el navegador abierto
+        self.browser = None
+        self.context = None
+        self.page = None
+        self._caido = False
+        self._capitulos_actual = 0
+        self.capitulos = 0
+        self.arranques = 0
+        self.tiempo_arranque = 0.0
+        self.tiempo_cierre = 0.0
+        self.ultima_navegacion = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    def _marcar_caido(self, origen):
+        # Ignorar eventos tardíos de un navegador/página que ya se reemplazó
+        if origen is self.browser or origen is self.page:
+            self._caido = True
+
+    def _iniciar(self):
+        with self.metricas.medir("navegador_espera_hueco_segundos"):
+            LIMITES.navegadores.acquire()
+        self._limites = limites = LIMITES
+        inicio = time.monotonic()
+        try:
+            self.browser = self._playwright.firefox.launch(headless=True, firefox_user_prefs={
+                "network.http.max-connections": limites.conexiones_navegador,
+                "network.http.max-persistent-connections-per-server": limites.conexiones_navegador,
+            })
+        except BaseException:
+            self._liberar_hueco()
+            raise
+        self.browser.on("disconnected", self._marcar_caido)
+        self.context = self.browser.new_context()
+        self.page = self.context.new_page()
+        self.page.on("crash", self._marcar_caido)
+        if limites.bytes_por_segundo:
+            self.page.route(_es_url_imagen, lambda route: self._medir_imagen(route, limites))
+        if self.capturar:
+            self.page.on("response", self._anotar_respuesta)
+        self._caido = False
+        self._capitulos_actual = 0
+        self.arranques += 1
+        duracion = time.monotonic() - inicio
+        self.tiempo_arranque += duracion
+        self.metricas.observar("navegador_arranque_segundos", duracion)
+
+    def _liberar_hueco(self):
+        if self._limites is not None:
+            self._limites.navegadores.release()
+            self._limites = None
+
+    def cerrar(self):
+        """Cierra el navegador actual (si hay uno) y acumula el tiempo de cierre."""
+        if self.browser is None:
+            return
+        inicio = time.monotonic()
+        try:
+            self.browser.close()
+        except Exception as e:
+            append_log(f"[DESCARGAR] Error cerrando el navegador: {e}")
+        self.browser = self.context = self.page = None
+        self._liberar_hueco()
+        duracion = time.monotonic() - inicio
+        self.tiempo_cierre += duracion
+        self.metricas.observar("navegador_cierre_segundos", duracion)
+
+    def _anotar_respuesta(self, response):
+        # Solo se guarda la referencia; el cuerpo se pide después, y solo si hace falta
+        if _es_url_imagen(response.url):
+            self.respuestas[response.url] = response
+
+    def _medir_imagen(self, route, limites):
+        """
+        Pide la imagen por el navegador, descuenta sus bytes del ancho de banda
+        global y la entrega tras la espera que toque. La espera es de Playwright
+        (no bloquea el resto de peticiones de la página); si algo falla se
+        aborta y la imagen se baja luego por HTTP.
+        """
+        from playwright.sync_api import Error as PlaywrightError
+
+        try:
+            respuesta = route.fetch()
+            cuerpo = respuesta.body()
+            self.metricas.sumar("navegador_bytes_recibidos", len(cuerpo))
+            espera = limites.ancho_banda.reservar(len(cuerpo))
+            if espera:
+                self.metricas.observar("navegador_espera_ancho_banda_segundos", espera)
+                route.request.frame.page.wait_for_timeout(espera * 1000)
+            route.fulfill(response=respuesta, body=cuerpo)
+        except PlaywrightError:
+            with contextlib.suppress(PlaywrightError):
+                route.abort()
+
+    def _necesita_reinicio(self):
+        return (
+            self.browser is None
+            or self._caido
+            or not self.browser.is_connected()
+            or self.page.is_closed()
+            or self._capitulos_actual >= self.max_capitulos
+        )
+
+    def abrir(self, url):
+        """Navega a 'url' reutilizando la página actual. Reintenta una vez con un navegador nuevo."""
+        from playwright.sync_api import Error as PlaywrightError
+
+        for intento in range(2):
+            if self._necesita_reinicio():
+                if self.browser is not None:
+                    append_log("[DESCARGAR] Reiniciando navegador...")
+                self.cerrar()
+                self._iniciar()
+            try:
+                self.respuestas = {}
+                inicio = time.perf_counter()
+                self.page.goto(url)
+                self.ultima_navegacion = time.perf_counter() - inicio
+                self.metricas.observar("capitulo_goto_segundos", self.ultima_navegacion)
+                break
+            except PlaywrightError as e:
+                if intento == 1:
+                    raise
+                self.metricas.sumar("navegador_reintentos")
+                append_log(f"[DESCARGAR] El navegador falló al abrir el capítulo ({e}). Reintentando...")
+                self._caido = True
+        self._capitulos_actual += 1
+        self.capitulos += 1
+        return self.page
+
+    def resumen(self):
+        """Texto con el coste de arranque/cierre total y por capítulo."""
+        total = self.tiempo_arranque + self.tiempo_cierre
+        por_capitulo = total / self.capitulos if self.capitulos else 0.0
+        return (
+            f"{self.arranques} arranque(s), arranque {self.tiempo_arranque:.2f} s, "
+            f"cierre {self.tiempo_cierre:.2f} s, {por_capitulo:.2f} s/capítulo "
+            f"({self.capitulos} capítulos)"
+        )
+
+
+##############################
+# SECCIÓN: Motores de descarga HTTP
+##############################
+
+class ErrorReintentable(Exception):
+    """Fallo transitorio de una petición (timeout, red, 429 o 5xx) que se puede reintentar."""
+
+    def __init__(self, mensaje, espera=None):
+        super().__init__(mensaje)
+        self.espera = espera  # Retry-After del servidor (s), si lo indicó
+
+
+def _espera_reintento(intento, retry_after=None):
+    """Espera exponencial con jitter antes del reintento 'intento' (desde 0), respetando Retry-After."""
+    espera = min(ESPERA_REINTENTO_MAX, ESPERA_REINTENTO_BASE * 2 ** intento) * random.uniform(0.5, 1.0)
+    if retry_after:
+        espera = max(espera, min(retry_after, ESPERA_REINTENTO_MAX))
+    return espera
+
+
+# Respuestas que indican un fallo pasajero del servidor: se reintentan
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+
+def _retry_after(headers):
+    try:
+        return float(headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
+
+class ControlConcurrencia:
+    """
+    Límite adaptable de peticiones de imágenes simultáneas (AIMD, como el
+    control de congestión de TCP). Cada respuesta correcta sube el límite en
+    1/límite, es decir, +1 por ronda. Un error transitorio, o una latencia
+    media más de FACTOR_LATENCIA veces la mejor vista, lo reduce a la mitad.
+    Tras un recorte hay que esperar una ronda de respuestas antes del
+    siguiente, para que una ráfaga de errores no lo hunda de golpe.
+    """
+
+    def __init__(self, inicial=DESCARGAS_SIMULTANEAS, minimo=CONCURRENCIA_MIN, maximo=CONCURRENCIA_MAX):
+        self.minimo = minimo
+        self.maximo = max(minimo, maximo)
+        self.limite = float(min(max(inicial, self.minimo), self.maximo))
+        self.limite_maximo = int(self.limite)
+        self.recortes = 0
+        self._cond = threading.Condition()
+        self._avisos = []           # Corrutinas esperando hueco (motor async)
+        self._en_uso = 0
+        self._latencia = None       # Media móvil exponencial
+        self._latencia_base = None  # Mejor media vista
+        self._desde_recorte = 0
+
+    def _hay_hueco(self):
+        return self._en_uso < int(self.limite)
+
+    def adquirir(self):
+        """Espera un hueco libre; devuelve el instante de inicio para liberar()."""
+        with self._cond:
+            self._cond.wait_for(self._hay_hueco)
+            self._en_uso += 1
+        return time.perf_counter()
+
+    def intentar_adquirir(self):
+        """Como adquirir() pero sin esperar: devuelve None si no hay hueco."""
+        with self._cond:
+            if not self._hay_hueco():
+                return None
+            self._en_uso += 1
+        return time.perf_counter()
+
+    async def adquirir_async(self):
+        """Como adquirir() sin bloquear el bucle asyncio: espera el aviso de liberar()."""
+        import asyncio
+        bucle = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self._hay_hueco():
+                    self._en_uso += 1
+                    return time.perf_counter()
+                aviso = bucle.create_future()
+                self._avisos.append((bucle, aviso))
+            await aviso
+
+    def liberar(self, inicio, exito):
+        """Devuelve el hueco. 'exito': True (respondió), False (error transitorio) o None (no cuenta)."""
+        latencia = time.perf_counter() - inicio
+        with self._cond:
+            self._en_uso -= 1
+            if exito is not None:
+                self._ajustar(exito, latencia)
+            self._cond.notify_all()
+            _despertar_avisos(self._avisos)
+
+    def _ajustar(self, exito, latencia):
+        # Requiere el lock
+        anterior = int(self.limite)
+        self._desde_recorte += 1
+        congestion = not exito
+        if exito:
+            self._latencia = latencia if self._latencia is None else 0.8 * self._latencia + 0.2 * latencia
+            if self._latencia_base is None or self._latencia < self._latencia_base:
+                self._latencia_base = self._latencia
+            congestion = self._latencia > FACTOR_LATENCIA * max(self._latencia_base, 0.05)
+        if congestion:
+            if self._desde_recorte < anterior:
+                return
+            self.limite = max(float(self.minimo), self.limite / 2)
+            self._desde_recorte = 0
+            self.recortes += 1
+            # La latencia de referencia se rehace con el nuevo límite
+            self._latencia_base = self._latencia
+        else:
+            self.limite = min(float(self.maximo), self.limite + 1 / self.limite)
+        self.limite_maximo = max(self.limite_maximo, int(self.limite))
+        if int(self.limite) != anterior and (congestion or int(self.limite) % 4 == 0):
+            motivo = "error" if not exito else ("latencia" if congestion else "respuestas rápidas")
+            append_log(f"[DESCARGAR] Concurrencia {anterior} -> {int(self.limite)} ({motivo})")
+
+    def resumen(self):
+        return f"límite final {int(self.limite)}, máximo {self.limite_maximo}, {self.recortes} recortes"
+
+
+class MotorHilos:
+    """
+    Motor por defecto: requests + ThreadPoolExecutor.
+    El pool de conexiones bloquea al alcanzar 'conexiones_por_host', así las
+    conexiones se reutilizan (keep-alive). Hay hilos para CONCURRENCIA_MAX
+    peticiones, pero solo trabajan a la vez las que permite 'control'.
+    """
+
+    def __init__(self, max_workers=CONCURRENCIA_MAX, conexiones_por_host=CONEXIONES_POR_HOST):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=conexiones_por_host, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.control = ControlConcurrencia(maximo=max_workers)
+
+    def enviar(self, ctx, img_url, chapter_folder, idx, page_url):
+        return self._executor.submit(
+            _download_single_image, self.session, self.control, ctx, img_url, chapter_folder, idx, page_url
+        )
+
+    def cerrar(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+
+class MotorAsync:
+    """
+    Motor asyncio: un cliente httpx en un bucle propio (hilo aparte), con
+    límite de conexiones por host y HTTP/2 opcional (requiere 'httpx[http2]').
+    El bucle solo hace red: la caché, el disco, el diario y los callbacks de
+    los futures que devuelve enviar() van a un pool pequeño de hilos, para
+    que una escritura lenta no frene al resto de descargas.
+    """
+
+    def __init__(self, max_workers=CONCURRENCIA_MAX, conexiones_por_host=CONEXIONES_POR_HOST,
+                 http2=USAR_HTTP2):
+        import asyncio
+        try:
+            import httpx
+        except ImportError:
+            raise RuntimeError("El motor 'async' necesita httpx: pip install httpx (o httpx[http2])")
+
+        self._conexiones_por_host = conexiones_por_host
+        self.control = ControlConcurrencia(maximo=max_workers)
+        self._semaforos = {}
+        self._pendientes = set()
+        self._lock = threading.Lock()
+        self._hilos_disco = concurrent.futures.ThreadPoolExecutor(max_workers=HILOS_DISCO_ASYNC)
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(self._hilos_disco)
+        self._hilo = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._hilo.start()
+
+        async def _crear_cliente():
+            limites = httpx.Limits(max_connections=max_workers, max_keepalive_connections=max_workers)
+            timeout = httpx.Timeout(TIMEOUT_LECTURA, connect=TIMEOUT_CONEXION, pool=None)
+            return httpx.AsyncClient(limits=limites, http2=http2, timeout=timeout)
+
+        self.client = asyncio.run_coroutine_threadsafe(_crear_cliente(), self._loop).result()
+
+    def _semaforo(self, img_url, page_url):
+        # Solo se llama dentro del bucle, no necesita lock
+        import asyncio
+        host = urllib.parse.urlparse(urllib.parse.urljoin(page_url, img_url)).netloc
+        if host not in self._semaforos:
+            self._semaforos[host] = asyncio.Semaphore(self._conexiones_por_host)
+        return self._semaforos[host]
+
+    async def _descargar(self, future, ctx, img_url, chapter_folder, idx, page_url):
+        try:
+            estado = await _download_single_image_async(
+                self.client, self._semaforo(img_url, page_url), self.control,
+                ctx, img_url, chapter_folder, idx, page_url
+            )
+        except Exception as e:
+            await _en_hilo(future.set_exception, e)
+        else:
+            # Los callbacks (diario, CBZ, progreso) corren donde se resuelve el future: fuera del bucle
+            await _en_hilo(future.set_result, estado)
+
+    def enviar(self, ctx, img_url, chapter_folder, idx, page_url):
+        import asyncio
+        future = concurrent.futures.Future()
+        with self._lock:
+            self._pendientes.add(future)
+        future.add_done_callback(self._terminado)
+        asyncio.run_coroutine_threadsafe(self._descargar(future, ctx, img_url, chapter_folder, idx, page_url),
+                                         self._loop)
+        return future
+
+    def _terminado(self, future):
+        with self._lock:
+            self._pendientes.discard(future)
+
+    def cerrar(self):
+        import asyncio
+        with self._lock:
+            pendientes = list(self._pendientes)
+        concurrent.futures.wait(pendientes)
+        asyncio.run_coroutine_threadsafe(self.client.aclose(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._hilo.join()
+        self._loop.close()
+        # Espera también a los callbacks que aún se estén ejecutando
+        self._hilos_disco.shutdown(wait=True)
+
+
+MOTORES_DESCARGA = {"hilos": MotorHilos, "async": MotorAsync}
+
+
+def crear_motor_descargas(nombre=None):
+    """Crea el motor de descargas 'nombre' ("hilos" o "async"); por defecto MOTOR_DESCARGAS."""
+    nombre = nombre or MOTOR_DESCARGAS
+    if nombre not in MOTORES_DESCARGA:
+        raise ValueError(f"Motor de descargas desconocido: {nombre}")
+    return MOTORES_DESCARGA[nombre]()
+
+
+##############################
+# SECCIÓN: Almacén de imágenes (caché)
+##############################
+
+def _abrir_sqlite(ruta):
+    """Abre una base SQLite compartible entre hilos (el acceso se serializa con un lock aparte)."""
+    db = sqlite3.connect(ruta, check_same_thread=False, timeout=30)
+    db.execute("PRAGMA journal_mode=WAL")
+    return db
+
+
+def _reflink(origen, destino):
+    """Clona 'origen' en 'destino' compartiendo bloques (Btrfs/XFS). Solo Linux."""
+    import fcntl
+    FICLONE = 0x40049409
+    with open(origen, "rb") as src, open(destino, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(destino)
+            raise
+
+
+def _enlazar(origen, destino):
+    """
+    Coloca 'origen' en 'destino' sin duplicar datos: hardlink, si no reflink,
+    y como último recurso una copia normal.
+    Los archivos enlazados comparten contenido con la caché: no modificarlos en sitio.
+    """
+    if os.path.lexists(destino):
+        os.remove(destino)
+    try:
+        os.link(origen, destino)
+        return
+    except OSError:
+        pass
+    try:
+        _reflink(origen, destino)
+        return
+    except (ImportError, OSError):
+        pass
+    shutil.copy2(origen, destino)
+
+
+class AlmacenImagenes:
+    """
+    Caché direccionada por contenido: cada imagen se guarda una sola vez como
+    cache_images/<sha256 de los bytes><ext>, aunque llegue desde varias URLs.
+    Un índice SQLite (cache_images/indice.sqlite) asocia cada URL a su hash y
+    guarda tamaño, último acceso y aciertos de cada imagen, así las búsquedas
+    no tocan el disco y se puede expulsar lo menos usado (LRU) para no pasar
+    de 'max_bytes'.
+    """
+
+    def __init__(self, cache_dir, max_bytes=MAX_BYTES_CACHE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = _abrir_sqlite(os.path.join(cache_dir, "indice.sqlite"))
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS imagenes ("
+                " hash TEXT PRIMARY KEY, ext TEXT NOT NULL, tamanio INTEGER NOT NULL,"
+                " ultimo_acceso REAL NOT NULL, aciertos INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS imagenes_acceso ON imagenes (ultimo_acceso)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS urls_hash ON urls (hash)")
+        self._total = self._db.execute("SELECT COALESCE(SUM(tamanio), 0) FROM imagenes").fetchone()[0]
+        conocidas = {h + e for h, e in self._db.execute("SELECT hash, ext FROM imagenes")}
+
+        # Un único recorrido al abrir: borra restos de descargas interrumpidas y
+        # anota los archivos de cachés anteriores (<sha256 de la URL><ext>)
+        self._antiguas = set()
+        for entry in os.scandir(cache_dir):
+            if entry.name.endswith(".part"):
+                os.remove(entry.path)
+            elif not entry.name.startswith("indice.sqlite") and entry.name not in conocidas:
+                self._antiguas.add(entry.name)
+
+        # Estadísticas de la corrida
+        self.aciertos = 0
+        self.fallos = 0
+        self.bytes_ahorrados = 0
+        self.expulsadas = 0
+
+    def ruta(self, sha, ext):
+        return os.path.join(self.cache_dir, sha + ext)
+
+    def buscar(self, url):
+        """Devuelve (ruta, tamaño) de la imagen asociada a 'url', o None si no está en caché."""
+        with self._lock:
+            fila = self._db.execute(
+                "SELECT i.hash, i.ext, i.tamanio FROM urls u JOIN imagenes i ON i.hash = u.hash WHERE u.url = ?",
+                (url,)
+            ).fetchone()
+            if fila:
+                with self._db:
+                    self._db.execute(
+                        "UPDATE imagenes SET ultimo_acceso = ?, aciertos = aciertos + 1 WHERE hash = ?",
+                        (time.time(), fila[0])
+                    )
+                self.aciertos += 1
+                self.bytes_ahorrados += fila[2]
+                return self.ruta(fila[0], fila[1]), fila[2]
+        encontrada = self._migrar_entrada_antigua(url)
+        with self._lock:
+            if encontrada:
+                self.aciertos += 1
+                self.bytes_ahorrados += encontrada[1]
+            else:
+                self.fallos += 1
+        return encontrada
+
+    def _migrar_entrada_antigua(self, url):
+        ext = os.path.splitext(urllib.parse.urlparse(url).path)[1] or ".webp"
+        nombre = hashlib.sha256(url.encode('utf-8')).hexdigest() + ext
+        with self._lock:
+            if nombre not in self._antiguas:
+                return None
+            self._antiguas.discard(nombre)
+        antigua = os.path.join(self.cache_dir, nombre)
+        sha = hashlib.sha256()
+        with open(antigua, "rb") as f:
+            for data in iter(lambda: f.read(TAMANIO_BLOQUE), b""):
+                sha.update(data)
+        tamanio = os.path.getsize(antigua)
+        return self.guardar(url, antigua, sha.hexdigest(), ext, tamanio), tamanio
+
+    def contiene(self, url):
+        """True si 'url' ya está en el índice (sin contar acierto ni actualizar el acceso)."""
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM urls WHERE url = ?", (url,)).fetchone() is not None
+
+    def nueva_descarga(self):
+        """Archivo temporal dentro de la caché donde escribir una descarga."""
+        return DescargaTemporal(self.cache_dir)
+
+    def guardar(self, url, ruta_temporal, sha, ext, tamanio):
+        """Mueve 'ruta_temporal' a su sitio definitivo (o la descarta si ya existía) y registra la URL."""
+        ruta = self.ruta(sha, ext)
+        with self._lock:
+            existe = self._db.execute("SELECT 1 FROM imagenes WHERE hash = ?", (sha,)).fetchone()
+            if existe:
+                os.remove(ruta_temporal)
+            else:
+                os.replace(ruta_temporal, ruta)
+                self._total += tamanio
+            with self._db:
+                self._db.execute(
+                    "INSERT OR IGNORE INTO imagenes (hash, ext, tamanio, ultimo_acceso) VALUES (?, ?, ?, ?)",
+                    (sha, ext, tamanio, time.time())
+                )
+                self._db.execute("INSERT OR REPLACE INTO urls (url, hash) VALUES (?, ?)", (url, sha))
+            if self._total > self.max_bytes:
+                self._expulsar(conservar=sha)
+        return ruta
+
+    def _expulsar(self, conservar=None):
+        """Borra las imágenes usadas hace más tiempo hasta bajar del 90% de 'max_bytes'. Requiere el lock."""
+        objetivo = self.max_bytes * 0.9
+        filas = self._db.execute("SELECT hash, ext, tamanio FROM imagenes ORDER BY ultimo_acceso")
+        expulsar = []
+        total = self._total
+        for sha, ext, tamanio in filas:
+            if total <= objetivo:
+                break
+            if sha == conservar:
+                continue
+            expulsar.append((sha, ext))
+            total -= tamanio
+        with self._db:
+            for sha, ext in expulsar:
+                try:
+                    os.remove(self.ruta(sha, ext))
+                except FileNotFoundError:
+                    pass
+                self._db.execute("DELETE FROM urls WHERE hash = ?", (sha,))
+                self._db.execute("DELETE FROM imagenes WHERE hash = ?", (sha,))
+        self._total = total
+        self.expulsadas += len(expulsar)
+
+    def olvidar(self, url):
+        """Quita 'url' del índice (p. ej. si su archivo desapareció de la caché)."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM urls WHERE url = ?", (url,))
+
+    def resumen(self):
+        """Texto con la tasa de aciertos y los bytes ahorrados en esta corrida."""
+        consultas = self.aciertos + self.fallos
+        tasa = 100 * self.aciertos / consultas if consultas else 0.0
+        return (
+            f"{self.aciertos}/{consultas} aciertos ({tasa:.0f}%), "
+            f"{self.bytes_ahorrados / (1024 * 1024):.1f} MiB ahorrados, "
+            f"{self.expulsadas} expulsadas, ocupa {self._total / (1024 * 1024):.1f} MiB "
+            f"de {self.max_bytes / (1024 * 1024):.0f} MiB"
+        )
+
+    def cerrar(self):
+        with self._lock:
+            self._db.close()
+
+
+class DescargaTemporal:
+    """Archivo .part en la caché que calcula el SHA-256 mientras se escribe."""
+
+    def __init__(self, cache_dir):
+        fd, self.ruta = tempfile.mkstemp(dir=cache_dir, suffix=".part")
+        self._f = os.fdopen(fd, "wb")
+        self._sha = hashlib.sha256()
+        self.tamanio = 0
+
+    def escribir(self, chunk):
+        self._f.write(chunk)
+        self._sha.update(chunk)
+        self.tamanio += len(chunk)
+
+    def hexdigest(self):
+        return self._sha.hexdigest()
+
+    def cerrar(self):
+        self._f.close()
+
+    def descartar(self):
+        self._f.close()
+        if os.path.exists(self.ruta):
+            os.remove(self.ruta)
+
+
+##############################
+# SECCIÓN: Diario de descargas (reanudar)
+##############################
+
+class DiarioDescargas:
+    """
+    Diario por serie (Nombre_de_la_serie/diario_descargas.sqlite): guarda la
+    última corrida (URL inicial y capítulo final) y, por capítulo, su URL,
+    número, carpeta, lista de imágenes, enlace al siguiente y qué imágenes ya
+    se completaron. Con él se reanuda sin abrir en el navegador los capítulos
+    ya recorridos y bajando solo las imágenes que faltan.
+    Las carpetas y CBZ se guardan relativos a la serie y se devuelven
+    absolutos, así el diario sigue valiendo si se mueve la serie.
+    """
+
+    NOMBRE = "diario_descargas.sqlite"
+
+    def __init__(self, serie_dir):
+        self.serie_dir = serie_dir
+        self._lock = threading.Lock()
+        self._db = _abrir_sqlite(os.path.join(serie_dir, self.NOMBRE))
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS corrida (clave TEXT PRIMARY KEY, valor TEXT)")
+            # siguiente: NULL = aún no se sabe, '' = no hay siguiente capítulo
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS capitulos ("
+                " url TEXT PRIMARY KEY, numero TEXT NOT NULL, carpeta TEXT NOT NULL,"
+                " siguiente TEXT, completo INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS imagenes ("
+                " capitulo TEXT NOT NULL, idx INTEGER NOT NULL, url TEXT NOT NULL,"
+                " estado TEXT NOT NULL DEFAULT 'pendiente', PRIMARY KEY (capitulo, idx))"
+            )
+            # Páginas escritas en cada CBZ (filtro de duplicados del modo CBZ); 'quitada' si no está en él.
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS paginas_cbz ("
+                " hash TEXT NOT NULL, capitulo TEXT NOT NULL, nombre TEXT NOT NULL,"
+                " quitada INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (hash, capitulo, nombre))"
+            )
+
+    def _relativa(self, ruta):
+        return os.path.relpath(ruta, self.serie_dir)
+
+    def _absoluta(self, ruta):
+        return os.path.normpath(os.path.join(self.serie_dir, ruta))
+
+    def iniciar_corrida(self, url, final_chapter, salida="carpetas", prefix=""):
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO corrida (clave, valor) VALUES (?, ?)",
+                [("url_inicial", url), ("capitulo_final", str(final_chapter)),
+                 ("salida", salida), ("prefijo", prefix or "")]
+            )
+
+    def corrida(self):
+        """Devuelve (url inicial, capítulo final, salida, prefijo) de la última corrida, o None."""
+        with self._lock:
+            datos = dict(self._db.execute("SELECT clave, valor FROM corrida"))
+        if "url_inicial" not in datos:
+            return None
+        return (datos["url_inicial"], datos["capitulo_final"],
+                datos.get("salida", "carpetas"), datos.get("prefijo", ""))
+
+    def ultimo_capitulo(self):
+        """URL del capítulo con el número más alto que se haya registrado, o None."""
+        with self._lock:
+            filas = self._db.execute("SELECT url, numero FROM capitulos").fetchall()
+        mejor = None
+        for url, numero in filas:
+            try:
+                valor = float(numero)
+            except ValueError:
+                continue
+            if mejor is None or valor > mejor[0]:
+                mejor = (valor, url)
+        return mejor[1] if mejor else None
+
+    def capitulo(self, url):
+        """Datos del capítulo 'url' (numero, carpeta, siguiente, completo) o None."""
+        with self._lock:
+            fila = self._db.execute(
+                "SELECT numero, carpeta, siguiente, completo FROM capitulos WHERE url = ?", (url,)
+            ).fetchone()
+        if not fila:
+            return None
+        return {"numero": fila[0], "carpeta": self._absoluta(fila[1]), "siguiente": fila[2], "completo": bool(fila[3])}
+
+    def registrar_capitulo(self, url, numero, carpeta, image_urls):
+        """Registra un capítulo recién recorrido. Conserva el estado de las imágenes que no cambiaron."""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO capitulos (url, numero, carpeta) VALUES (?, ?, ?) "
+                "ON CONFLICT (url) DO UPDATE SET numero = excluded.numero, carpeta = excluded.carpeta",
+                (url, numero, self._relativa(carpeta))
+            )
+            anteriores = dict(self._db.execute("SELECT idx, url FROM imagenes WHERE capitulo = ?", (url,)))
+            self._db.execute("DELETE FROM imagenes WHERE capitulo = ? AND idx > ?", (url, len(image_urls)))
+            for idx, img_url in enumerate(image_urls, start=1):
+                if anteriores.get(idx) != img_url:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO imagenes (capitulo, idx, url) VALUES (?, ?, ?)",
+                        (url, idx, img_url)
+                    )
+            self._actualizar_completo(url)
+
+    def registrar_siguiente(self, url, siguiente):
+        with self._lock, self._db:
+            self._db.execute("UPDATE capitulos SET siguiente = ? WHERE url = ?", (siguiente or "", url))
+
+    def carpetas_incompletas(self):
+        """Carpetas de los capítulos que aún tienen imágenes pendientes."""
+        with self._lock:
+            filas = self._db.execute("SELECT carpeta FROM capitulos WHERE completo = 0").fetchall()
+        return {self._absoluta(carpeta) for carpeta, in filas}
+
+    def imagenes_pendientes(self, url):
+        """Lista [(idx, url de la imagen)] que aún no se completaron en el capítulo 'url'."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT idx, url FROM imagenes WHERE capitulo = ? AND estado = 'pendiente' ORDER BY idx", (url,)
+            ).fetchall()
+
+    def imagenes(self, url):
+        """Lista [(idx, url de la imagen)] de todas las imágenes del capítulo 'url'."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT idx, url FROM imagenes WHERE capitulo = ? ORDER BY idx", (url,)
+            ).fetchall()
+
+    def anotar_pagina(self, sha, capitulo, nombre):
+        """
+        Anota que la página 'nombre' del CBZ 'capitulo' tiene hash 'sha'.
+        Devuelve True si ese hash ya está en otra página de la serie: entonces
+        se da por quitada, porque no se debe incluir.
+        """
+        capitulo = self._relativa(capitulo)
+        with self._lock, self._db:
+            repetida = self._db.execute(
+                "SELECT 1 FROM paginas_cbz WHERE hash = ? AND (capitulo != ? OR nombre != ?) LIMIT 1",
+                (sha, capitulo, nombre)
+            ).fetchone() is not None
+            self._db.execute(
+                "INSERT INTO paginas_cbz (hash, capitulo, nombre, quitada) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (hash, capitulo, nombre) DO UPDATE SET quitada = excluded.quitada",
+                (sha, capitulo, nombre, int(repetida))
+            )
+        return repetida
+
+    def paginas_repetidas(self):
+        """[(CBZ, nombre)] de las páginas que siguen en su CBZ aunque su hash esté en otra página."""
+        with self._lock:
+            filas = self._db.execute(
+                "SELECT capitulo, nombre FROM paginas_cbz AS p WHERE quitada = 0 AND EXISTS ("
+                " SELECT 1 FROM paginas_cbz AS o WHERE o.hash = p.hash"
+                " AND (o.capitulo != p.capitulo OR o.nombre != p.nombre)) ORDER BY capitulo, nombre"
+            ).fetchall()
+        return [(self._absoluta(capitulo), nombre) for capitulo, nombre in filas]
+
+    def marcar_quitadas(self, capitulo, nombres):
+        capitulo = self._relativa(capitulo)
+        with self._lock, self._db:
+            self._db.executemany("UPDATE paginas_cbz SET quitada = 1 WHERE capitulo = ? AND nombre = ?",
+                                 [(capitulo, nombre) for nombre in nombres])
+
+    def marcar_imagen(self, url, idx, estado):
+        """'estado' es "ok" (guardada) u "omitida" (pequeña); ambas cuentan como completadas."""
+        with self._lock, self._db:
+            self._db.execute("UPDATE imagenes SET estado = ? WHERE capitulo = ? AND idx = ?", (estado, url, idx))
+            self._actualizar_completo(url)
+
+    def _actualizar_completo(self, url):
+        # Requiere el lock y una transacción abierta
+        pendientes = self._db.execute(
+            "SELECT COUNT(*) FROM imagenes WHERE capitulo = ? AND estado = 'pendiente'", (url,)
+        ).fetchone()[0]
+        self._db.execute("UPDATE capitulos SET completo = ? WHERE url = ?", (int(pendientes == 0), url))
+
+    def borrar_capitulos(self):
+        """Olvida todos los capítulos (p. ej. tras borrar las carpetas)."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM paginas_cbz")
+            self._db.execute("DELETE FROM imagenes")
+            self._db.execute("DELETE FROM capitulos")
+
+    def cerrar(self):
+        with self._lock:
+            self._db.close()
+
+
+##############################
+# SECCIÓN: Salida directa a CBZ
+##############################
+class EscritorCBZ:
+    """
+    Escribe las imágenes de un capítulo directamente en su CBZ, en orden de
+    página, según van llegando (salida "cbz" de descargar). La imagen a la que
+    le toca se copia al CBZ en el momento; las que llegan antes de su turno se
+    enlazan desde la caché en una carpeta de espera (<cbz>.parcial), que nunca
+    guarda más imágenes que las que hay en vuelo. Las páginas omitidas o que
+    fallaron se saltan. Se escribe en <cbz>.tmp y se renombra al terminar.
+
+    Como luego no hay carpetas sobre las que pasar eliminar_duplicados_img, se
+    aplica la misma regla que allí: una imagen cuyo contenido se repite en la
+    serie no queda en ningún capítulo. Las copias que llegan cuando ya se
+    conoce otra se saltan aquí; la que entró antes la quita
+    _quitar_paginas_repetidas() al acabar la corrida. Así el resultado no
+    depende de qué capítulo termine primero.
+    """
+
+    def __init__(self, output_cbz, indices, diario):
+        self.output_cbz = output_cbz
+        self.terminado = False
+        self._diario = diario
+        self._temporal = output_cbz + ".tmp"
+        self._espera_dir = output_cbz + ".parcial"
+        self._orden = sorted(indices)
+        self._pos = 0
+        self._listas = {}  # idx -> ruta en la carpeta de espera, o None si la página se salta
+        self._colocadas = set()
+        self._escritas = 0
+        self._lock = threading.Lock()
+        os.makedirs(self._espera_dir, exist_ok=True)
+        self._zip = zipfile.ZipFile(self._temporal, "w")
+
+    def colocar(self, idx, cache_path, nombre):
+        """
+        Añade la página 'idx' (un archivo de la caché) como 'nombre'.
+        Devuelve False si no se incluye por estar repetida en la serie.
+        """
+        sha = os.path.splitext(os.path.basename(cache_path))[0]
+        if self._diario.anotar_pagina(sha, self.output_cbz, nombre):
+            return False
+        with self._lock:
+            self._colocadas.add(idx)
+            if self._orden[self._pos] == idx:
+                self._escribir(cache_path, nombre)
+                self._pos += 1
+                self._avanzar()
+            else:
+                espera = os.path.join(self._espera_dir, nombre)
+                _enlazar(cache_path, espera)
+                self._listas[idx] = espera
+        return True
+
+    def terminada(self, idx):
+        """Avisa de que la descarga de 'idx' terminó; si no se colocó, esa página se salta."""
+        with self._lock:
+            if self.terminado:
+                return
+            if idx not in self._colocadas:
+                self._listas[idx] = None
+            self._avanzar()
+            if self._pos == len(self._orden):
+                self._finalizar()
+
+    def _avanzar(self):
+        # Requiere el lock: escribe las páginas en espera que ya tienen su turno
+        while self._pos < len(self._orden) and self._orden[self._pos] in self._listas:
+            espera = self._listas.pop(self._orden[self._pos])
+            if espera:
+                self._escribir(espera, os.path.basename(espera))
+                os.remove(espera)
+            self._pos += 1
+
+    def _escribir(self, ruta, nombre):
+        zinfo = zipfile.ZipInfo.from_file(ruta, arcname=nombre)
+        zinfo.compress_type = COMPRESION_CBZ.get(os.path.splitext(nombre)[1].lower(), zipfile.ZIP_DEFLATED)
+        with open(ruta, "rb") as src, self._zip.open(zinfo, "w") as dst:
+            shutil.copyfileobj(src, dst, BLOQUE_CBZ)
+        self._escritas += 1
+
+    def _finalizar(self):
+        self.terminado = True
+        self._zip.close()
+        shutil.rmtree(self._espera_dir, ignore_errors=True)
+        if self._escritas:
+            os.replace(self._temporal, self.output_cbz)
+        else:
+            os.remove(self._temporal)
+
+    def abortar(self):
+        """Descarta el CBZ a medias si la corrida se corta; al reanudar se vuelve a escribir."""
+        with self._lock:
+            if self.terminado:
+                return
+            self.terminado = True
+            self._zip.close()
+            shutil.rmtree(self._espera_dir, ignore_errors=True)
+            if os.path.exists(self._temporal):
+                os.remove(self._temporal)
+
+
+def _quitar_paginas_repetidas(diario, serie_dir):
+    """
+    Al acabar una corrida con salida a CBZ: quita de los CBZ ya escritos las
+    páginas que entraron antes de que apareciera otra copia (p. ej. los
+    créditos del primer capítulo). Los CBZ que aún no existen se saltan:
+    al reescribirlos, EscritorCBZ ya no incluye esas páginas.
+    """
+    por_cbz = {}
+    for output_cbz, nombre in diario.paginas_repetidas():
+        por_cbz.setdefault(output_cbz, set()).add(nombre)
+    for output_cbz, nombres in por_cbz.items():
+        if not os.path.isfile(output_cbz):
+            continue
+        short_cbz = shorten_path(output_cbz, serie_dir)
+        try:
+            _reescribir_cbz_sin(output_cbz, nombres)
+        except (OSError, zipfile.BadZipFile) as e:
+            append_log(f"[DESCARGAR] No se pudieron quitar las páginas repetidas de {short_cbz}: {e}")
+            continue
+        diario.marcar_quitadas(output_cbz, nombres)
+        append_log(f"[DESCARGAR] Quitadas {len(nombres)} páginas repetidas de {short_cbz}")
+
+
+def _reescribir_cbz_sin(output_cbz, nombres):
+    """Reescribe 'output_cbz' sin las entradas 'nombres'; si no queda ninguna, lo borra."""
+    temporal = output_cbz + ".tmp"
+    quedan = 0
+    with zipfile.ZipFile(output_cbz) as origen, zipfile.ZipFile(temporal, "w") as destino:
+        for info in origen.infolist():
+            if info.filename in nombres:
+                continue
+            zinfo = zipfile.ZipInfo(info.filename, info.date_time)
+            zinfo.compress_type = info.compress_type
+            zinfo.external_attr = info.external_attr
+            with origen.open(info) as src, destino.open(zinfo, "w") as dst:
+                shutil.copyfileobj(src, dst, BLOQUE_CBZ)
+            quedan += 1
+    if quedan:
+        os.replace(temporal, output_cbz)
+    else:
+        os.remove(temporal)
+        os.remove(output_cbz)
+
+
+##############################
+# SECCIÓN: Índice de hashes (duplicados)
+##############################
+
+class IndiceHashes:
+    """
+    Índice persistente (Nombre_de_la_serie/indice_hashes.sqlite) con los hashes
+    ya calculados de cada imagen, por (ruta relativa, tamaño, mtime). Si el
+    archivo no cambió no se vuelve a leer del disco.
+    Guarda el SHA-256 parcial y completo y los hashes perceptuales (dHash/pHash).
+    """
+
+    NOMBRE = "indice_hashes.sqlite"
+    TIPOS = ("parcial", "completo", "dhash", "phash")
+
+    def __init__(self, serie_dir):
+        self.serie_dir = serie_dir
+        self._db = _abrir_sqlite(os.path.join(serie_dir, self.NOMBRE))
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS hashes ("
+                " ruta TEXT PRIMARY KEY, tamanio INTEGER NOT NULL, mtime INTEGER NOT NULL,"
+                " parcial TEXT, completo TEXT, dhash TEXT, phash TEXT)"
+            )
+        self._filas = {}
+        for fila in self._db.execute(f"SELECT ruta, tamanio, mtime, {', '.join(self.TIPOS)} FROM hashes"):
+            self._filas[fila[0]] = dict(zip(("tamanio", "mtime") + self.TIPOS, fila[1:]))
+
+    def _clave(self, ruta):
+        return os.path.relpath(ruta, self.serie_dir)
+
+    def obtener(self, ruta, tamanio, mtime, tipo):
+        """Hash 'tipo' guardado para 'ruta', o None si falta o el archivo cambió."""
+        fila = self._filas.get(self._clave(ruta))
+        if not fila or fila["tamanio"] != tamanio or fila["mtime"] != mtime:
+            return None
+        return fila[tipo]
+
+    def guardar(self, ruta, tamanio, mtime, **hashes):
+        clave = self._clave(ruta)
+        fila = self._filas.get(clave)
+        if not fila or fila["tamanio"] != tamanio or fila["mtime"] != mtime:
+            fila = dict.fromkeys(self.TIPOS)
+            fila.update(tamanio=tamanio, mtime=mtime)
+            self._filas[clave] = fila
+        fila.update(hashes)
+
+    def olvidar_faltantes(self, rutas_existentes):
+        """Quita del índice las rutas que ya no están en 'rutas_existentes'."""
+        vigentes = {self._clave(r) for r in rutas_existentes}
+        for clave in list(self._filas):
+            if clave not in vigentes:
+                del self._filas[clave]
+
+    def cerrar(self):
+        """Escribe el índice en disco y lo cierra."""
+        columnas = ("tamanio", "mtime") + self.TIPOS
+        with self._db:
+            self._db.execute("DELETE FROM hashes")
+            self._db.executemany(
+                f"INSERT INTO hashes (ruta, {', '.join(columnas)}) VALUES ({', '.join('?' * (len(columnas) + 1))})",
+                [(clave,) + tuple(fila[c] for c in columnas) for clave, fila in self._filas.items()]
+            )
+        self._db.close()
+
+
+def _hash_archivo(ruta, limite=None):
+    """SHA-256 de 'ruta'; con 'limite' solo de los primeros 'limite' bytes."""
+    sha256 = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        if limite is not None:
+            sha256.update(f.read(limite))
+        else:
+            for data in iter(lambda: f.read(TAMANIO_BLOQUE), b""):
+                sha256.update(data)
+    return sha256.hexdigest()
+
+
+def _hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def _matriz_dct(n):
+    """Matriz de la DCT-II ortonormal de tamaño n x n."""
+    import numpy as np
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matriz = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matriz[0, :] /= np.sqrt(2.0)
+    return matriz
+
+
+def _hashes_perceptuales(rutas):
+    """
+    dHash y pHash (64 bits cada uno) de un lote de imágenes. Cada imagen se
+    reduce a escala de grises y el cálculo se hace a la vez para todo el lote
+    con numpy. Devuelve ({ruta: (dhash, phash)}, {ruta: error}).
+    Requiere Pillow y numpy.
+    """
+    import numpy as np
+    from PIL import Image
+
+    validas, errores, mini, reducidas = [], {}, [], []
+    for ruta in rutas:
+        try:
+            with Image.open(ruta) as im:
+                im.draft("L", (64, 64))  # JPEG: decodifica ya reducida
+                gris = im.convert("L")
+            mini.append(np.asarray(gris.resize((9, 8), Image.BILINEAR), dtype=np.float32))
+            reducidas.append(np.asarray(gris.resize((32, 32), Image.BILINEAR), dtype=np.float32))
+            validas.append(ruta)
+        except Exception as e:
+            errores[ruta] = e
+    if not validas:
+        return {}, errores
+
+    n = len(validas)
+    # dHash: ¿cada píxel es más claro que su vecino izquierdo? (8x8 comparaciones)
+    mini = np.stack(mini)
+    dbits = (mini[:, :, 1:] > mini[:, :, :-1]).reshape(n, 64)
+    # pHash: coeficientes 8x8 de baja frecuencia de la DCT 32x32 frente a su mediana
+    dct = _matriz_dct(32)
+    coef = np.einsum("ij,njk,lk->nil", dct, np.stack(reducidas), dct)[:, :8, :8].reshape(n, 64)
+    pbits = coef > np.median(coef[:, 1:], axis=1, keepdims=True)
+
+    def a_entero(bits):
+        return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+    return {ruta: (a_entero(dbits[i]), a_entero(pbits[i])) for i, ruta in enumerate(validas)}, errores
+
+
+class _NodoBK:
+    __slots__ = ("valor", "datos", "hijos")
+
+    def __init__(self, valor, dato):
+        self.valor = valor
+        self.datos = [dato]
+        self.hijos = {}
+
+
+class ArbolBK:
+    """
+    Árbol BK con distancia de Hamming: encuentra los hashes a distancia <= umbral
+    de uno dado podando ramas, sin comparar contra todos los demás.
+    """
+
+    def __init__(self):
+        self._raiz = None
+
+    def agregar(self, valor, dato):
+        if self._raiz is None:
+            self._raiz = _NodoBK(valor, dato)
+            return
+        nodo = self._raiz
+        while True:
+            distancia = _hamming(valor, nodo.valor)
+            if distancia == 0:
+                nodo.datos.append(dato)
+                return
+            hijo = nodo.hijos.get(distancia)
+            if hijo is None:
+                nodo.hijos[distancia] = _NodoBK(valor, dato)
+                return
+            nodo = hijo
+
+    def buscar(self, valor, umbral):
+        """Datos de todos los hashes a distancia <= 'umbral' de 'valor'."""
+        encontrados = []
+        pendientes = [self._raiz] if self._raiz else []
+        while pendientes:
+            nodo = pendientes.pop()
+            distancia = _hamming(valor, nodo.valor)
+            if distancia <= umbral:
+                encontrados.extend(nodo.datos)
+            for d, hijo in nodo.hijos.items():
+                if distancia - umbral <= d <= distancia + umbral:
+                    pendientes.append(hijo)
+        return encontrados
+
+
+def _grupos_casi_duplicados(archivos, indice, serie_dir, umbral):
+    """
+    Agrupa las imágenes de 'archivos' [(ruta, tamaño, mtime)] que son casi
+    iguales: pHash a distancia <= 'umbral' (buscado con un árbol BK) y dHash
+    también dentro del umbral. Los hashes salen del índice o se calculan por
+    lotes en paralelo.
+    """
+    hashes = {}
+    por_calcular = []
+    for ruta, tamanio, mtime in archivos:
+        dhash = indice.obtener(ruta, tamanio, mtime, "dhash")
+        phash = indice.obtener(ruta, tamanio, mtime, "phash")
+        if dhash and phash:
+            hashes[ruta] = (int(dhash, 16), int(phash, 16))
+        else:
+            por_calcular.append((ruta, tamanio, mtime))
+
+    desde_indice = len(hashes)
+    datos = {ruta: (tamanio, mtime) for ruta, tamanio, mtime in por_calcular}
+    lotes = [[a[0] for a in por_calcular[i:i + LOTE_PERCEPTUAL]]
+             for i in range(0, len(por_calcular), LOTE_PERCEPTUAL)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=HILOS_HASH) as executor:
+        for resultados, errores in executor.map(_hashes_perceptuales, lotes):
+            for ruta, (dhash, phash) in resultados.items():
+                hashes[ruta] = (dhash, phash)
+                indice.guardar(ruta, *datos[ruta], dhash=f"{dhash:016x}", phash=f"{phash:016x}")
+            for ruta, e in errores.items():
+                append_log(f"[DUPLICADOS] No se pudo analizar {shorten_path(ruta, serie_dir)}: {e}")
+    append_log(f"[DUPLICADOS] Hashes perceptuales: {len(por_calcular)} calculados, "
+               f"{desde_indice} desde el índice.")
+
+    arbol = ArbolBK()
+    for ruta, (_, phash) in hashes.items():
+        arbol.agregar(phash, ruta)
+
+    # Unión de componentes: A~B y B~C deja A, B y C en el mismo grupo
+    padre = {}
+
+    def raiz(x):
+        while padre.get(x, x) != x:
+            padre[x] = padre.get(padre[x], padre[x])
+            x = padre[x]
+        return x
+
+    for ruta, (dhash, phash) in hashes.items():
+        for otra in arbol.buscar(phash, umbral):
+            if otra != ruta and _hamming(dhash, hashes[otra][0]) <= umbral:
+                padre[raiz(otra)] = raiz(ruta)
+
+    grupos = {}
+    for ruta in hashes:
+        grupos.setdefault(raiz(ruta), []).append(ruta)
+    return [g for g in grupos.values() if len(g) > 1]
+
+
+##############################
+# SECCIÓN: Funciones unificadas
+##############################
+
+def descargar(serie_name, url, final_chapter, motor=None, buscar_nuevos=False, salida="carpetas", prefix="",
+              progreso=None):
+    """Descarga capítulos desde 'url' hasta 'final_chapter', guardando en:
+       Nombre_de_la_serie/Capitulos_Carpetas/<nro_capítulo>/.
+       Con 'final_chapter' vacío o None sigue hasta que no haya capítulo siguiente.
+       'motor' elige el motor HTTP ("hilos" o "async"); por defecto MOTOR_DESCARGAS.
+       'buscar_nuevos' (modo actualizar) vuelve a mirar si apareció un capítulo
+       siguiente en los que antes eran el último.
+       Con salida="cbz" no se crean carpetas: cada capítulo se escribe directamente
+       en Nombre_de_la_serie/comics_archivos/<prefix> <nro_capítulo>.cbz.
+       'progreso' (opcional) recibe textos con el avance, p. ej. para el planificador.
+       Devuelve False si la descarga no se pudo hacer (el motivo queda en el log).
+    """
+    append_log(f"[DESCARGAR] Serie: {serie_name} | URL capítulo: {url} | Capítulo final: {final_chapter or '-'}")
+
+    if salida not in ("carpetas", "cbz"):
+        append_log(f"[DESCARGAR] Error: salida desconocida '{salida}' (usa 'carpetas' o 'cbz').")
+        return False
+    if salida == "cbz" and not prefix:
+        append_log("[DESCARGAR] Error: la salida directa a CBZ necesita un prefijo.")
+        return False
+
+    if not final_chapter:
+        final_chapter = ""
+        final_chapter_val = float("inf")
+    else:
+        try:
+            final_chapter_val = float(final_chapter)
+        except ValueError:
+            append_log("[DESCARGAR] Error: el capítulo final no es numérico.")
+            return False
+
+    serie_dir = os.path.join(os.getcwd(), serie_name)
+    capitulos_dir = os.path.join(serie_dir, "Capitulos_Carpetas")
+    if salida == "cbz":
+        os.makedirs(os.path.join(serie_dir, "comics_archivos"), exist_ok=True)
+    else:
+        os.makedirs(capitulos_dir, exist_ok=True)
+
+    try:
+        motor_descargas = crear_motor_descargas(motor)
+    except (ValueError, RuntimeError) as e:
+        append_log(f"[DESCARGAR] Error: {e}")
+        return False
+
+    # Carpeta caché
+    cache_dir = os.path.join(serie_dir, "cache_images")
+    os.makedirs(cache_dir, exist_ok=True)
+    ctx = ContextoDescarga(serie_dir, cache_dir, salida=salida, prefix=prefix, progreso=progreso)
+    ctx.diario.iniciar_corrida(url, final_chapter, salida, prefix)
+    inicio_corrida = time.perf_counter()
+
+    # Productor (navegador) -> cola acotada -> consumidor (pool HTTP).
+    # La cola acotada frena al navegador si las descargas van por detrás.
+    cola = queue.Queue(maxsize=MAX_CAPITULOS_EN_COLA)
+    consumidor = threading.Thread(
+        target=_consumir_capitulos,
+        args=(cola, ctx, motor_descargas),
+        daemon=True
+    )
+    consumidor.start()
+    try:
+        _recorrer_capitulos(url, final_chapter_val, capitulos_dir, ctx, cola, buscar_nuevos)
+    finally:
+        cola.put(None)
+        append_log("[DESCARGAR] Esperando a que terminen las descargas pendientes...")
+        consumidor.join()
+        motor_descargas.cerrar()
+        if salida == "cbz":
+            _quitar_paginas_repetidas(ctx.diario, serie_dir)
+        append_log(f"[DESCARGAR] Caché: {ctx.almacen.resumen()}")
+        ctx.metricas.observar("corrida_segundos", time.perf_counter() - inicio_corrida)
+        append_log(f"[DESCARGAR] Concurrencia: {motor_descargas.control.resumen()}")
+        _guardar_metricas(ctx, serie_name, motor or MOTOR_DESCARGAS, motor_descargas.control)
+        ctx.cerrar()
+
+    if ctx.detenida.is_set():
+        append_log("[DESCARGAR] Descarga interrumpida por un error; usa Reanudar para completarla.\n")
+        return False
+    append_log("[DESCARGAR] Descarga completada.\n")
+    return True
+
+
+def _guardar_metricas(ctx, serie_name, motor, control):
+    """Pasa a ctx.metricas las cifras de la caché y guarda el resumen de la corrida según FORMATO_METRICAS."""
+    almacen = ctx.almacen
+    ctx.metricas.sumar("cache_aciertos", almacen.aciertos)
+    ctx.metricas.sumar("cache_fallos", almacen.fallos)
+    ctx.metricas.sumar("cache_bytes_ahorrados", almacen.bytes_ahorrados)
+    ctx.metricas.sumar("cache_expulsadas", almacen.expulsadas)
+    append_log(f"[DESCARGAR] Tiempo por etapa: {ctx.metricas.resumen()}")
+    if not FORMATO_METRICAS:
+        return
+    try:
+        os.makedirs(ctx.metricas_dir, exist_ok=True)
+        if FORMATO_METRICAS in ("json", "ambos"):
+            ctx.metricas.guardar_json(
+                os.path.join(ctx.metricas_dir, f"corrida_{ctx.marca}.json"),
+                serie=serie_name, motor=motor, salida=ctx.salida, marca=ctx.marca,
+                concurrencia={"final": int(control.limite), "maxima": control.limite_maximo,
+                              "recortes": control.recortes},
+                configuracion={
+                    "DESCARGAS_SIMULTANEAS": DESCARGAS_SIMULTANEAS,
+                    "CONCURRENCIA_MIN": CONCURRENCIA_MIN,
+                    "CONCURRENCIA_MAX": CONCURRENCIA_MAX,
+                    "CONEXIONES_POR_HOST": CONEXIONES_POR_HOST,
+                    "TIMEOUT_CONEXION": TIMEOUT_CONEXION,
+                    "TIMEOUT_LECTURA": TIMEOUT_LECTURA,
+                    "REINTENTOS_IMAGEN": REINTENTOS_IMAGEN,
+                    "MAX_CAPITULOS_EN_COLA": MAX_CAPITULOS_EN_COLA,
+                    "PAUSA_ENTRE_CAPITULOS": PAUSA_ENTRE_CAPITULOS,
+                    "COMPROBAR_CON_HEAD": COMPROBAR_CON_HEAD,
+                    "CAPTURAR_IMAGENES_NAVEGADOR": CAPTURAR_IMAGENES_NAVEGADOR,
+                    "USAR_HTTP2": USAR_HTTP2,
+                },
+            )
+        if FORMATO_METRICAS in ("prometheus", "ambos"):
+            ctx.metricas.guardar_prometheus(os.path.join(ctx.metricas_dir, "descargar.prom"), serie=serie_name)
+    except OSError as e:
+        append_log(f"[DESCARGAR] No se pudieron guardar las métricas: {e}")
+
+
+def reanudar(serie_name, motor=None, progreso=None):
+    """
+    Reanuda la última descarga de la serie usando su diario: los capítulos ya
+    completos se saltan sin abrir el navegador y de los incompletos solo se
+    bajan las imágenes que faltan. Devuelve False si no hay nada que reanudar
+    o la descarga falla.
+    """
+    serie_dir = os.path.join(os.getcwd(), serie_name)
+    if not os.path.exists(os.path.join(serie_dir, DiarioDescargas.NOMBRE)):
+        append_log(f"[DESCARGAR] La serie {serie_name} no tiene una descarga que reanudar.")
+        return False
+    diario = DiarioDescargas(serie_dir)
+    corrida = diario.corrida()
+    diario.cerrar()
+    if corrida is None:
+        append_log(f"[DESCARGAR] La serie {serie_name} no tiene una descarga que reanudar.")
+        return False
+    url, final_chapter, salida, prefix = corrida
+    append_log(f"[DESCARGAR] Reanudando descarga de {serie_name}...")
+    return descargar(serie_name, url, final_chapter or None, motor, salida=salida, prefix=prefix,
+                     progreso=progreso)
+
+
+def actualizar_serie(serie_name, url=None, motor=None, salida=None, prefix=None, progreso=None):
+    """
+    Baja solo los capítulos nuevos de una serie: parte del último capítulo que
+    conoce el diario (o de 'url' si la serie aún no tiene diario) y avanza
+    hasta que no haya enlace al siguiente. Los capítulos ya completos no se
+    vuelven a renderizar; del último solo se busca el enlace al siguiente.
+    Sin 'salida'/'prefix' se usan los de la última corrida.
+    Devuelve False si no se sabe desde dónde empezar o la descarga falla.
+    """
+    serie_dir = os.path.join(os.getcwd(), serie_name)
+    ultima = None
+    corrida = None
+    if os.path.exists(os.path.join(serie_dir, DiarioDescargas.NOMBRE)):
+        diario = DiarioDescargas(serie_dir)
+        ultima = diario.ultimo_capitulo()
+        corrida = diario.corrida()
+        diario.cerrar()
+    if corrida:
+        salida = salida or corrida[2]
+        prefix = prefix or corrida[3]
+
+    if ultima:
+        append_log(f"[DESCARGAR] Actualizando {serie_name} desde el último capítulo conocido: {ultima}")
+        url = ultima
+    elif url:
+        append_log(f"[DESCARGAR] {serie_name} no tiene diario; se actualiza desde {url}")
+    else:
+        append_log(f"[DESCARGAR] {serie_name} no tiene diario: ingresa la URL de un capítulo para empezar.")
+        return False
+    return descargar(serie_name, url, None, motor, buscar_nuevos=True, salida=salida or "carpetas",
+                     prefix=prefix or "", progreso=progreso)
+
+
+def _es_capitulo_final(chapter_number, final_chapter_val):
+    try:
+        current_chapter_val = float(chapter_number)
+    except ValueError:
+        return False
+    return bool(current_chapter_val) and current_chapter_val >= final_chapter_val
+
+
+def _imagenes_a_encolar(ctx, chapter_url, destino):
+    """
+    Imágenes del capítulo que hay que (volver a) procesar. Con salida a
+    carpetas, solo las pendientes; con salida a CBZ, si falta alguna o no
+    está el CBZ, todas, porque el CBZ se reescribe entero (las ya bajadas
+    salen de la caché).
+    """
+    pendientes = ctx.diario.imagenes_pendientes(chapter_url)
+    if ctx.salida == "cbz" and (pendientes or not os.path.isfile(destino)):
+        return ctx.diario.imagenes(chapter_url)
+    return pendientes
+
+
+def _destino_capitulo(ctx, capitulos_dir, chapter_number):
+    """Carpeta del capítulo o, con salida a CBZ, ruta de su CBZ."""
+    if ctx.salida == "cbz":
+        return os.path.join(ctx.serie_dir, "comics_archivos", f"{ctx.prefix} {chapter_number}.cbz")
+    return os.path.join(capitulos_dir, chapter_number)
+
+
+def _encolar(ctx, cola, trabajo):
+    """Pone un capítulo en la cola; el tiempo bloqueado mide cuánto frenan las descargas al navegador."""
+    with ctx.metricas.medir("cola_bloqueo_segundos"):
+        cola.put(trabajo)
+
+
+def _encolar_pendientes(ctx, cola, chapter_url, capitulo):
+    """Encola solo las imágenes que faltan de un capítulo que el diario ya conoce."""
+    pendientes = _imagenes_a_encolar(ctx, chapter_url, capitulo["carpeta"])
+    if pendientes:
+        append_log(f"[DESCARGAR] Capítulo {capitulo['numero']}: faltan {len(pendientes)} imágenes.")
+        _encolar(ctx, cola, (chapter_url, capitulo["carpeta"], pendientes, chapter_url))
+    else:
+        append_log(f"[DESCARGAR] Capítulo {capitulo['numero']} ya descargado, se omite.")
+
+
+def _recorrer_capitulos(url, final_chapter_val, capitulos_dir, ctx, cola, buscar_nuevos=False):
+    """
+    Productor: recorre los capítulos y encola
+    (url del capítulo, carpeta, [(idx, url de imagen)], url de la página) para el consumidor.
+    Los capítulos que el diario ya conoce no se abren en el navegador; si falta
+    saber cuál es su siguiente, se abren solo para leer ese enlace.
+    Con 'buscar_nuevos', un capítulo que antes era el último se trata como si
+    no se supiera su siguiente, y una carpeta ya llena que el diario no conoce
+    se da por completa.
+    """
+    from playwright.sync_api import sync_playwright
+
+    serie_dir = ctx.serie_dir
+    with sync_playwright() as p, GestorNavegador(p, metricas=ctx.metricas,
+                                                 capturar=CAPTURAR_IMAGENES_NAVEGADOR) as navegador:
+        next_url = url
+        while next_url and not ctx.detenida.is_set():
+            chapter_url = next_url
+            capitulo = ctx.diario.capitulo(chapter_url)
+            if ctx.salida == "cbz":
+                if capitulo and not capitulo["carpeta"].endswith(".cbz"):
+                    capitulo = None  # Se bajó antes a carpeta: se vuelve a recorrer para el CBZ
+            elif capitulo and not os.path.isdir(capitulo["carpeta"]):
+                capitulo = None  # Se borró la carpeta: hay que volver a bajarlo
+
+            if capitulo:
+                siguiente = capitulo["siguiente"]
+                if buscar_nuevos and siguiente == "":
+                    siguiente = None
+                if siguiente is not None or _es_capitulo_final(capitulo["numero"], final_chapter_val):
+                    _encolar_pendientes(ctx, cola, chapter_url, capitulo)
+                    if _es_capitulo_final(capitulo["numero"], final_chapter_val):
+                        append_log(f"[DESCARGAR] Alcanzado capítulo final {capitulo['numero']}. Deteniendo.")
+                        break
+                    next_url = siguiente or None
+                    continue
+
+            # Mantenemos la URL completa del capítulo
+            append_log(f"[DESCARGAR] Abriendo capítulo: {chapter_url}")
+            page = navegador.abrir(chapter_url)
+
+            if capitulo:
+                # Ya recorrido: solo hace falta el enlace al siguiente, no se vuelve a renderizar
+                chapter_number = capitulo["numero"]
+                _encolar_pendientes(ctx, cola, chapter_url, capitulo)
+            else:
+                inicio_espera = time.monotonic()
+                chapter_number = _get_chapter_number(page)
+                espera_numero = time.monotonic() - inicio_espera
+                ctx.metricas.observar("capitulo_espera_numero_segundos", espera_numero)
+                desconocido = chapter_number is None
+                if desconocido:
+                    # Carpeta propia por URL: dos capítulos sin número no se pisan
+                    chapter_number = f"Desconocido_{hashlib.sha1(chapter_url.encode()).hexdigest()[:8]}"
+
+                # Carpeta (o CBZ) del capítulo (mostrarla en corto en log)
+                chapter_folder = _destino_capitulo(ctx, capitulos_dir, chapter_number)
+                short_chapter_folder = shorten_path(chapter_folder, serie_dir)
+
+                if buscar_nuevos and not desconocido and (
+                        os.path.isfile(chapter_folder) if ctx.salida == "cbz"
+                        else _carpeta_con_imagenes(chapter_folder)):
+                    # Descargado antes de existir el diario: se registra como completo
+                    append_log(f"[DESCARGAR] {short_chapter_folder} ya existe, se omite.")
+                    ctx.diario.registrar_capitulo(chapter_url, chapter_number, chapter_folder, [])
+                else:
+                    if ctx.salida == "carpetas":
+                        os.makedirs(chapter_folder, exist_ok=True)
+                    inicio_espera = time.monotonic()
+                    image_urls = [urllib.parse.urljoin(page.url, src) for src in _extract_image_urls(page)]
+                    espera_imagenes = time.monotonic() - inicio_espera
+                    ctx.metricas.observar("capitulo_espera_imagenes_segundos", espera_imagenes)
+                    append_log(f"[DESCARGAR] Espera de carga: {espera_numero:.2f} s (número) + "
+                               f"{espera_imagenes:.2f} s (imágenes)")
+                    ctx.estadisticas.anotar(chapter_folder, numero=chapter_number,
+                                            goto_s=navegador.ultima_navegacion,
+                                            espera_numero_s=espera_numero, espera_imagenes_s=espera_imagenes)
+
+                    ctx.diario.registrar_capitulo(chapter_url, chapter_number, chapter_folder, image_urls)
+                    pendientes = _imagenes_a_encolar(ctx, chapter_url, chapter_folder)
+                    if navegador.capturar and pendientes:
+                        _guardar_capturas(ctx, navegador.respuestas, chapter_folder, pendientes)
+                    append_log(f"[DESCARGAR] Encolando {len(pendientes)} imágenes para: {short_chapter_folder}")
+                    _encolar(ctx, cola, (chapter_url, chapter_folder, pendientes, page.url))
+
+            # Ver si se alcanzó el capítulo final
+            if _es_capitulo_final(chapter_number, final_chapter_val):
+                append_log(f"[DESCARGAR] Alcanzado capítulo final {chapter_number}. Deteniendo.")
+                break
+
+            with ctx.metricas.medir("capitulo_siguiente_segundos"):
+                next_url = _get_next_chapter_link(page)
+            ctx.diario.registrar_siguiente(chapter_url, next_url)
+            if next_url:
+                ctx.metricas.observar("pausa_entre_capitulos_segundos", PAUSA_ENTRE_CAPITULOS)
+                time.sleep(PAUSA_ENTRE_CAPITULOS)
+
+        navegador.cerrar()
+        if navegador.capitulos:
+            append_log(f"[DESCARGAR] Navegador: {navegador.resumen()}")
+
+
+def _guardar_capturas(ctx, respuestas, chapter_folder, imagenes):
+    """
+    Pasa a la caché los cuerpos de las imágenes [(idx, url)] que el navegador
+    ya bajó al recorrer la página, así el motor HTTP las encuentra allí y no
+    las vuelve a pedir. Las que no se cargaron, son pequeñas o no se pueden
+    leer se bajan por HTTP como siempre.
+    """
+    capturadas = bytes_capturados = 0
+    with ctx.metricas.medir("captura_navegador_segundos"):
+        for _, img_url in imagenes:
+            respuesta = respuestas.get(img_url)
+            if respuesta is None or respuesta.status != 200 or ctx.almacen.contiene(img_url):
+                continue
+            try:
+                cuerpo = respuesta.body()
+            except Exception:
+                continue  # El navegador ya no tiene el cuerpo: se baja por HTTP
+            if len(cuerpo) < ctx.min_size:
+                continue
+            ext = os.path.splitext(urllib.parse.urlparse(img_url).path)[1] or ".webp"
+            temporal = ctx.almacen.nueva_descarga()
+            try:
+                temporal.escribir(cuerpo)
+                temporal.cerrar()
+                ctx.almacen.guardar(img_url, temporal.ruta, temporal.hexdigest(), ext, temporal.tamanio)
+            except OSError as e:
+                temporal.descartar()
+                append_log(f"[DESCARGAR] No se pudo guardar la imagen del navegador {shorten_url(img_url)}: {e}")
+                continue
+            capturadas += 1
+            bytes_capturados += len(cuerpo)
+    ctx.metricas.sumar("navegador_imagenes_capturadas", capturadas)
+    ctx.metricas.sumar("navegador_bytes_capturados", bytes_capturados)
+    ctx.estadisticas.anotar(chapter_folder, capturadas=capturadas)
+    append_log(f"[DESCARGAR] Tomadas del navegador: {capturadas}/{len(imagenes)} imágenes "
+               f"({bytes_capturados / (1024 * 1024):.1f} MiB)")
+
+
+def _carpeta_con_imagenes(carpeta):
+    return os.path.isdir(carpeta) and any(
+        os.path.splitext(f)[1].lower() in EXT_VALIDAS for f in os.listdir(carpeta)
+    )
+
+
+def _get_chapter_number(page):
+    """Extrae el número de capítulo en la etiqueta <b class="text-xs md:text-base">."""
+    from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+    try:
+        elem = page.wait_for_selector(
+            "b.text-xs.md\\:text-base", state="attached", timeout=ESPERA_MAX_NUMERO_MS
+        )
+        chapter_number = elem.inner_text().strip()
+        append_log(f"[DESCARGAR] → Número de capítulo: {chapter_number}")
+        return chapter_number
+    except PlaywrightTimeoutError:
+        append_log(f"[DESCARGAR] No se encontró el número de capítulo en {ESPERA_MAX_NUMERO_MS // 1000} segundos.")
+    except Exception as e:
+        append_log(f"[DESCARGAR] Error extrayendo número de capítulo: {e}")
+    return None
+
+
+# Script que baja la página por pasos y termina en cuanto el conjunto de <img>
+# es estable: ninguna imagen pendiente y sin mutaciones/cargas durante
+# 'quietudMs'. Se despierta con eventos (MutationObserver, load/error de <img>),
+# no con esperas fijas. 'limiteMs' es la cota superior.
+_JS_ESPERAR_IMAGENES = """
+async ({quietudMs, limiteMs}) => {
+    const inicio = performance.now();
+    let ultimoCambio = inicio;
+    let despertar = null;
+    const avisar = () => {
+        ultimoCambio = performance.now();
+        if (despertar) { const d = despertar; despertar = null; d(); }
+    };
+    const obs = new MutationObserver(avisar);
+    obs.observe(document.documentElement, {
+        childList: true, subtree: true, attributes: true, attributeFilter: ['src', 'srcset']
+    });
+    document.addEventListener('load', avisar, true);
+    document.addEventListener('error', avisar, true);
+    const evento = (ms) => new Promise(res => { despertar = res; setTimeout(res, ms); });
+    const frame = () => new Promise(res => { requestAnimationFrame(() => res()); setTimeout(res, 50); });
+    const pendientes = () => Array.from(document.images)
+        .filter(i => i.getAttribute('src') && !i.complete).length;
+    const alFinal = () => window.scrollY + window.innerHeight
+        >= document.documentElement.scrollHeight - 2;
+    let agotado = false;
+    try {
+        while (true) {
+            const ahora = performance.now();
+            if (ahora - inicio > limiteMs) { agotado = true; break; }
+            if (!alFinal()) {
+                window.scrollBy(0, window.innerHeight);
+                await frame();
+                continue;
+            }
+            if (pendientes() === 0 && ahora - ultimoCambio >= quietudMs) break;
+            const resta = quietudMs - (ahora - ultimoCambio);
+            await evento(resta > 0 ? resta : quietudMs);
+        }
+    } finally {
+        obs.disconnect();
+        document.removeEventListener('load', avisar, true);
+        document.removeEventListener('error', avisar, true);
+    }
+    return {imagenes: document.images.length, agotado: agotado};
+}
+"""
+
+
+def _extract_image_urls(page):
+    """Hace scroll hasta cargar todas las imágenes y devuelve las URLs .webp del capítulo."""
+    from playwright.sync_api import Error as PlaywrightError
+
+    try:
+        estado = page.evaluate(
+            _JS_ESPERAR_IMAGENES,
+            {"quietudMs": QUIETUD_IMAGENES_MS, "limiteMs": ESPERA_MAX_IMAGENES_MS}
+        )
+        if estado["agotado"]:
+            append_log(f"[DESCARGAR] Carga incompleta tras {ESPERA_MAX_IMAGENES_MS // 1000} s: "
+                       f"{estado['imagenes']} imágenes detectadas.")
+        else:
+            append_log(f"[DESCARGAR] Página estable: {estado['imagenes']} imágenes detectadas.")
+    except PlaywrightError as e:
+        append_log(f"[DESCARGAR] Error esperando la carga de imágenes: {e}")
+
+    image_elements = page.query_selector_all("img")
+    image_urls = []
+    for img in image_elements:
+        src = img.get_attribute("src")
+        if src and src.lower().endswith(".webp") and "/cover" not in src.lower() and "discus" not in src.lower():
+            image_urls.append(src)
+
+    return image_urls
+
+
+def _imagen_en_disco(ctx, chapter_folder, idx):
+    """True si la carpeta del capítulo ya tiene imagen_NNN (en modo CBZ no hay carpeta que mirar)."""
+    if ctx.salida == "cbz":
+        return False
+    prefijo = f"imagen_{idx:03d}."
+    try:
+        return any(nombre.startswith(prefijo) for nombre in os.listdir(chapter_folder))
+    except OSError:
+        return False
+
+
+def _consumir_capitulos(cola, ctx, motor_descargas):
+    """
+    Consumidor: toma capítulos de 'cola' y reparte sus imágenes en el motor HTTP.
+    No espera a que termine un capítulo para empezar el siguiente; el semáforo
+    limita las imágenes en vuelo y así la memoria se mantiene plana.
+    Al acabar la primera pasada de un capítulo se verifica: los índices que
+    fallaron y siguen sin imagen_NNN se piden una vez más antes de darlos por
+    perdidos (quedan pendientes en el diario para 'Reanudar').
+    Si dos capítulos comparten carpeta, el segundo espera a que acabe el
+    primero. Si el consumidor falla, marca ctx.detenida para que el
+    productor pare y vacía la cola para que no se quede bloqueado en ella.
+    """
+    en_vuelo = threading.BoundedSemaphore(CONCURRENCIA_MAX * 2)
+    lock = threading.Condition()
+    capitulos = {}  # chapter_folder -> pasada en curso
+
+    def _cerrar_capitulo(chapter_folder):
+        with lock:
+            capitulos.pop(chapter_folder, None)
+            lock.notify_all()
+
+    def _terminar_imagen(chapter_url, chapter_folder, idx, estado):
+        ctx.estadisticas.imagen_terminada(chapter_folder, estado)
+        if estado:
+            ctx.diario.marcar_imagen(chapter_url, idx, estado)
+        escritor = ctx.escritores.get(chapter_folder)
+        if escritor:
+            try:
+                escritor.terminada(idx)
+            except Exception as e:
+                append_log(f"[DESCARGAR] Error escribiendo {shorten_path(chapter_folder, ctx.serie_dir)}: {e}")
+                escritor.abortar()
+            if escritor.terminado:
+                ctx.escritores.pop(chapter_folder, None)
+
+    def _verificar(chapter_folder, pasada):
+        faltan = []
+        for idx, img_url in pasada["fallidas"]:
+            if _imagen_en_disco(ctx, chapter_folder, idx):
+                _terminar_imagen(pasada["chapter_url"], chapter_folder, idx, "ok")
+            else:
+                faltan.append((idx, img_url))
+        if not faltan:
+            _cerrar_capitulo(chapter_folder)
+            return
+        indices = ", ".join(f"{idx:03d}" for idx, _ in faltan)
+        append_log(f"[DESCARGAR] Verificación de {shorten_path(chapter_folder, ctx.serie_dir)}: "
+                   f"faltan imagen_{indices}; se piden otra vez.")
+        ctx.metricas.sumar("imagenes_reverificadas", len(faltan))
+        with lock:
+            pasada.update(fallidas=[], pendientes=len(faltan), verificada=True)
+        # Sin el semáforo: esto corre en un callback del motor y esperar aquí podría bloquearlo
+        for idx, img_url in faltan:
+            future = motor_descargas.enviar(ctx, img_url, chapter_folder, idx, pasada["page_url"])
+            future.add_done_callback(_liberar(chapter_folder, idx, img_url, time.perf_counter(), False))
+
+    def _liberar(chapter_folder, idx, img_url, inicio, primera):
+        def _callback(future):
+            if primera:
+                en_vuelo.release()
+            estado = None if future.exception() else future.result()
+            ctx.metricas.observar("imagen_segundos", time.perf_counter() - inicio)
+            with lock:
+                pasada = capitulos[chapter_folder]
+                aplazada = estado is None and not pasada["verificada"]
+                if aplazada:
+                    pasada["fallidas"].append((idx, img_url))
+                pasada["pendientes"] -= 1
+                fin_pasada = pasada["pendientes"] == 0
+            if not aplazada:
+                _terminar_imagen(pasada["chapter_url"], chapter_folder, idx, estado)
+            if fin_pasada and pasada["verificada"]:
+                _cerrar_capitulo(chapter_folder)
+            elif fin_pasada:
+                try:
+                    _verificar(chapter_folder, pasada)
+                except Exception as e:
+                    append_log(f"[DESCARGAR] Error verificando {shorten_path(chapter_folder, ctx.serie_dir)}: {e}")
+                    _cerrar_capitulo(chapter_folder)
+        return _callback
+
+    try:
+        while True:
+            trabajo = cola.get()
+            if trabajo is None:
+                break
+            chapter_url, chapter_folder, imagenes, page_url = trabajo
+            with lock:
+                lock.wait_for(lambda: chapter_folder not in capitulos)
+            if ctx.salida == "cbz" and imagenes:
+                ctx.escritores[chapter_folder] = EscritorCBZ(chapter_folder, [idx for idx, _ in imagenes],
+                                                             ctx.diario)
+            ctx.estadisticas.iniciar(chapter_folder, len(imagenes))
+            if not imagenes:
+                continue
+            with lock:
+                capitulos[chapter_folder] = {"chapter_url": chapter_url, "page_url": page_url, "fallidas": [],
+                                             "pendientes": len(imagenes), "verificada": False}
+            for idx, img_url in imagenes:
+                with ctx.metricas.medir("imagenes_en_vuelo_espera_segundos"):
+                    en_vuelo.acquire()
+                future = motor_descargas.enviar(ctx, img_url, chapter_folder, idx, page_url)
+                future.add_done_callback(_liberar(chapter_folder, idx, img_url, time.perf_counter(), True))
+    except Exception as e:
+        append_log(f"[DESCARGAR] Error repartiendo las descargas, se detiene la corrida: {e}")
+        ctx.detenida.set()
+        while cola.get() is not None:
+            pass
+
+    # Las pasadas de verificación envían desde los callbacks: hay que esperarlas
+    # antes de que se cierre el motor
+    with lock:
+        lock.wait_for(lambda: not capitulos)
+
+
+class EstadisticasCapitulos:
+    """
+    Cuenta peticiones HTTP, bytes recibidos y resultado de las imágenes por
+    capítulo y lo muestra al terminarlo. Los totales van también a 'metricas'
+    y, si se pasa 'traza', cada capítulo terminado se escribe como una línea
+    JSON en ese archivo. 'progreso', si se pasa, recibe un texto con el avance
+    de la corrida cada vez que termina una imagen.
+    """
+
+    def __init__(self, serie_dir, metricas, traza=None, progreso=None):
+        self.serie_dir = serie_dir
+        self.metricas = metricas
+        self._traza = traza
+        self._progreso = progreso
+        self._lock = threading.Lock()
+        self._capitulos = {}
+        self._etapas = {}
+        self._total = {"capitulos": 0, "imagenes": 0, "terminadas": 0}
+
+    def _avisar(self):
+        if self._progreso:
+            with self._lock:
+                total = dict(self._total)
+            self._progreso(f"{total['capitulos']} capítulos, {total['terminadas']}/{total['imagenes']} imágenes")
+
+    def anotar(self, chapter_folder, **etapas):
+        """Guarda datos del productor (tiempos del navegador) para la traza del capítulo."""
+        with self._lock:
+            self._etapas.setdefault(chapter_folder, {}).update(etapas)
+
+    def iniciar(self, chapter_folder, total_imagenes):
+        with self._lock:
+            self._capitulos[chapter_folder] = {"imagenes": total_imagenes, "pendientes": total_imagenes,
+                                               "peticiones": 0, "bytes": 0, "ok": 0, "omitidas": 0,
+                                               "fallidas": 0, "inicio": time.perf_counter()}
+            self._total["imagenes"] += total_imagenes
+        if total_imagenes == 0:
+            self._mostrar(chapter_folder)
+
+    def sumar(self, chapter_folder, peticiones=0, bytes_recibidos=0):
+        with self._lock:
+            datos = self._capitulos[chapter_folder]
+            datos["peticiones"] += peticiones
+            datos["bytes"] += bytes_recibidos
+        if peticiones:
+            self.metricas.sumar("http_peticiones", peticiones)
+        if bytes_recibidos:
+            self.metricas.sumar("bytes_recibidos", bytes_recibidos)
+
+    def imagen_terminada(self, chapter_folder, estado):
+        """'estado' es el resultado de la descarga: "ok", "omitida" o None si falló."""
+        resultado = {"ok": "ok", "omitida": "omitidas"}.get(estado, "fallidas")
+        self.metricas.sumar(f"imagenes_{resultado}")
+        with self._lock:
+            datos = self._capitulos[chapter_folder]
+            datos[resultado] += 1
+            datos["pendientes"] -= 1
+            self._total["terminadas"] += 1
+            terminado = datos["pendientes"] == 0
+        if terminado:
+            self._mostrar(chapter_folder)
+        else:
+            self._avisar()
+
+    def _mostrar(self, chapter_folder):
+        with self._lock:
+            datos = self._capitulos.pop(chapter_folder)
+            etapas = self._etapas.pop(chapter_folder, {})
+            self._total["capitulos"] += 1
+        duracion = time.perf_counter() - datos["inicio"]
+        self.metricas.observar("capitulo_descarga_segundos", duracion)
+        append_log(f"[DESCARGAR] Capítulo {shorten_path(chapter_folder, self.serie_dir)} terminado: "
+                   f"{datos['peticiones']} peticiones HTTP, {datos['bytes'] / 1024:.0f} KiB recibidos")
+        if self._traza:
+            linea = {"capitulo": shorten_path(chapter_folder, self.serie_dir), "fin": time.time(),
+                     "descarga_s": round(duracion, 6)}
+            linea.update(etapas)
+            linea.update((k, datos[k]) for k in ("imagenes", "ok", "omitidas", "fallidas", "peticiones", "bytes"))
+            with self._lock:
+                self._traza.write(json.dumps(linea, ensure_ascii=False) + "\n")
+                self._traza.flush()
+        self._avisar()
+
+
+class ContextoDescarga:
+    """Datos compartidos por todas las descargas de imágenes de una misma corrida."""
+
+    def __init__(self, serie_dir, cache_dir, min_size=TAMANIO_MIN, comprobar_con_head=COMPROBAR_CON_HEAD,
+                 salida="carpetas", prefix="", progreso=None):
+        self.serie_dir = serie_dir
+        self.cache_dir = cache_dir
+        self.min_size = min_size
+        self.comprobar_con_head = comprobar_con_head
+        self.salida = salida
+        self.prefix = prefix
+        self.metricas = Metricas()
+        self.marca = time.strftime("%Y%m%d-%H%M%S")  # Nombre de los archivos de métricas de la corrida
+        self.metricas_dir = os.path.join(serie_dir, "metricas")
+        self._traza = None
+        if TRAZA_POR_CAPITULO:
+            os.makedirs(self.metricas_dir, exist_ok=True)
+            self._traza = open(os.path.join(self.metricas_dir, f"traza_{self.marca}.jsonl"), "a", encoding="utf-8")
+        self.estadisticas = EstadisticasCapitulos(serie_dir, self.metricas, self._traza, progreso)
+        self.almacen = AlmacenImagenes(cache_dir)
+        self.diario = DiarioDescargas(serie_dir)
+        self.escritores = {}  # Con salida a CBZ: ruta del CBZ -> EscritorCBZ del capítulo en curso
+        self.detenida = threading.Event()  # El consumidor falló: el productor deja de recorrer capítulos
+
+    def cerrar(self):
+        for escritor in list(self.escritores.values()):
+            escritor.abortar()
+        if self._traza:
+            self._traza.close()
+        self.almacen.cerrar()
+        self.diario.cerrar()
+
+
+def _preparar_imagen(img_url, chapter_folder, idx, page_url):
+    """Resuelve la URL de la imagen y devuelve (url, extensión, ruta en el capítulo)."""
+    if not img_url.startswith("http"):
+        img_url = urllib.parse.urljoin(page_url, img_url)
+    ext = os.path.splitext(urllib.parse.urlparse(img_url).path)[1] or ".webp"
+    dest_filename = os.path.join(chapter_folder, f"imagen_{idx:03d}{ext}")
+    return img_url, ext, dest_filename
+
+
+def _colocar_imagen(ctx, chapter_folder, idx, cache_path, dest_filename):
+    """
+    Pone la imagen de la caché en su capítulo: enlazada en la carpeta o, con
+    salida a CBZ, dentro del CBZ. Devuelve False si se omitió por repetida.
+    """
+    escritor = ctx.escritores.get(chapter_folder)
+    with ctx.metricas.medir("colocar_segundos"):
+        if escritor is None:
+            _enlazar(cache_path, dest_filename)
+            return True
+        colocada = escritor.colocar(idx, cache_path, os.path.basename(dest_filename))
+    if colocada:
+        return True
+    append_log(f"[DESCARGAR] Repetida en la serie, se omite: {shorten_path(dest_filename, ctx.serie_dir)}")
+    return False
+
+
+def _usar_cache(ctx, img_url, chapter_folder, idx, dest_filename):
+    """
+    Usa la imagen de la caché si ya se descargó (y no es pequeña).
+    Devuelve "ok", "omitida" (repetida) o None si no estaba en caché.
+    """
+    encontrada = ctx.almacen.buscar(img_url)
+    if not encontrada:
+        return None
+    cache_path, size = encontrada
+    if size < ctx.min_size:
+        return None
+    try:
+        if not _colocar_imagen(ctx, chapter_folder, idx, cache_path, dest_filename):
+            return "omitida"
+    except FileNotFoundError:
+        ctx.almacen.olvidar(img_url)
+        return None
+    append_log(f"[DESCARGAR] Usado caché: {shorten_path(dest_filename, ctx.serie_dir)}")
+    return "ok"
+
+
+def _es_pequena(ctx, status_code, headers, short_img_url):
+    """Usa el Content-Length de una respuesta (HEAD o GET) para descartar imágenes pequeñas."""
+    if status_code == 200 and "Content-Length" in headers:
+        size = int(headers["Content-Length"])
+        if size < ctx.min_size:
+            append_log(f"[DESCARGAR] Ignorando (pequeña) {short_img_url} ({size} bytes)")
+            return True
+    return False
+
+
+def _guardar_en_capitulo(ctx, img_url, ext, temporal, chapter_folder, idx, dest_filename):
+    """Tras descargar: descarta la imagen si es pequeña o la guarda en caché y la pone en el capítulo."""
+    temporal.cerrar()
+    if temporal.tamanio < ctx.min_size:
+        temporal.descartar()
+        return "omitida"
+    cache_path = ctx.almacen.guardar(img_url, temporal.ruta, temporal.hexdigest(), ext, temporal.tamanio)
+    if not _colocar_imagen(ctx, chapter_folder, idx, cache_path, dest_filename):
+        return "omitida"
+    append_log(f"[DESCARGAR] OK => {shorten_path(dest_filename, ctx.serie_dir)} ({temporal.tamanio} bytes)")
+    return "ok"
+
+
+def _siguiente_reintento(ctx, error, intento, short_img_url):
+    """Segundos a esperar antes de repetir tras 'error', o None si ya no quedan reintentos."""
+    if intento >= REINTENTOS_IMAGEN:
+        append_log(f"[DESCARGAR] Error descargando {short_img_url} tras {intento + 1} intentos: {error}")
+        return None
+    espera = _espera_reintento(intento, error.espera)
+    ctx.metricas.sumar("http_reintentos")
+    append_log(f"[DESCARGAR] {error} con {short_img_url}; reintento {intento + 1}/{REINTENTOS_IMAGEN} "
+               f"en {espera:.1f} s")
+    return espera
+
+
+def _download_single_image(session, control, ctx, img_url, chapter_folder, idx, page_url):
+    """
+    Descarga 1 imagen a la caché. Si >= ctx.min_size, se enlaza en 'chapter_folder'
+    (o se escribe en su CBZ). Devuelve "ok", "omitida" (pequeña o repetida) o None si falló.
+    Cada intento ocupa un hueco de 'control'; los fallos transitorios se
+    reintentan hasta REINTENTOS_IMAGEN veces, esperando sin ocupar el hueco.
+    La latencia que ve 'control' no incluye las esperas por LIMITES (conexión
+    libre y ancho de banda): si no, recortaría la concurrencia cuando lo que
+    está saturado es el límite global y no el servidor.
+    """
+    img_url, ext, dest_filename = _preparar_imagen(img_url, chapter_folder, idx, page_url)
+    short_img_url = shorten_url(img_url)  # Para no mostrar URL largas de imágenes
+    try:
+        # Verificar en caché
+        estado = _usar_cache(ctx, img_url, chapter_folder, idx, dest_filename)
+        if estado:
+            return estado
+
+        for intento in range(REINTENTOS_IMAGEN + 1):
+            inicio = control.adquirir()
+            pausas = []  # Esperas por el ancho de banda durante el intento
+            try:
+                with LIMITES.conexiones:
+                    inicio = time.perf_counter()
+                    estado = _pedir_imagen(session, ctx, img_url, ext, chapter_folder, idx, dest_filename,
+                                           short_img_url, pausas)
+            except ErrorReintentable as e:
+                control.liberar(inicio + sum(pausas), exito=False)
+                error = e
+            except Exception:
+                control.liberar(inicio, exito=None)
+                raise
+            else:
+                control.liberar(inicio + sum(pausas), exito=True)
+                return estado
+            espera = _siguiente_reintento(ctx, error, intento, short_img_url)
+            if espera is None:
+                return
+            time.sleep(espera)
+    except Exception as e:
+        append_log(f"[DESCARGAR] Error descargando {short_img_url}: {e}")
+
+
+def _pedir_imagen(session, ctx, img_url, ext, chapter_folder, idx, dest_filename, short_img_url, pausas):
+    """
+    Un intento de descarga con requests. Lanza ErrorReintentable si el fallo es
+    transitorio. Anota en 'pausas' lo que se esperó por el límite de ancho de banda.
+    """
+    import requests
+
+    timeout = (TIMEOUT_CONEXION, TIMEOUT_LECTURA)
+    try:
+        # HEAD para ver tamaño aproximado (solo en el modo antiguo)
+        if ctx.comprobar_con_head:
+            try:
+                ctx.estadisticas.sumar(chapter_folder, peticiones=1)
+                with ctx.metricas.medir("http_head_segundos"):
+                    head_resp = session.head(img_url, allow_redirects=True, timeout=timeout)
+                if _es_pequena(ctx, head_resp.status_code, head_resp.headers, short_img_url):
+                    return "omitida"
+            except Exception as e:
+                append_log(f"[DESCARGAR] HEAD error con {short_img_url}: {e}")
+
+        # Descarga; el Content-Length del GET permite cortar antes de leer el cuerpo
+        ctx.estadisticas.sumar(chapter_folder, peticiones=1)
+        inicio = time.perf_counter()
+        with session.get(img_url, stream=True, timeout=timeout) as resp:
+            ctx.metricas.observar("http_respuesta_segundos", time.perf_counter() - inicio)
+            if resp.status_code in ESTADOS_REINTENTABLES:
+                ctx.metricas.sumar("http_errores")
+                raise ErrorReintentable(f"Error {resp.status_code}", _retry_after(resp.headers))
+            if resp.status_code != 200:
+                ctx.metricas.sumar("http_errores")
+                append_log(f"[DESCARGAR] Error {resp.status_code} descargando {short_img_url}")
+                return
+            if _es_pequena(ctx, resp.status_code, resp.headers, short_img_url):
+                return "omitida"
+            temporal = ctx.almacen.nueva_descarga()
+            try:
+                for chunk in resp.iter_content(TAMANIO_BLOQUE):
+                    temporal.escribir(chunk)
+                    ctx.estadisticas.sumar(chapter_folder, bytes_recibidos=len(chunk))
+                    espera = LIMITES.ancho_banda.reservar(len(chunk))
+                    if espera:
+                        pausas.append(espera)
+                        time.sleep(espera)
+            except Exception:
+                temporal.descartar()
+                raise
+            ctx.metricas.observar("http_get_segundos", time.perf_counter() - inicio)
+    except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+        ctx.metricas.sumar("http_errores")
+        raise ErrorReintentable(type(e).__name__) from e
+    return _guardar_en_capitulo(ctx, img_url, ext, temporal, chapter_folder, idx, dest_filename)
+
+
+async def _en_hilo(funcion, *args):
+    """Ejecuta 'funcion' (disco, SQLite) en el pool de hilos del bucle, sin bloquearlo (como asyncio.to_thread)."""
+    import asyncio
+    return await asyncio.get_running_loop().run_in_executor(None, funcion, *args)
+
+
+async def _download_single_image_async(client, semaforo, control, ctx, img_url, chapter_folder, idx, page_url):
+    """
+    Igual que _download_single_image, pero con un cliente httpx asíncrono.
+    Lo que toca el disco (caché, capítulo, CBZ) se hace con _en_hilo().
+    """
+    import asyncio
+    img_url, ext, dest_filename = _preparar_imagen(img_url, chapter_folder, idx, page_url)
+    short_img_url = shorten_url(img_url)
+    try:
+        estado = await _en_hilo(_usar_cache, ctx, img_url, chapter_folder, idx, dest_filename)
+        if estado:
+            return estado
+
+        for intento in range(REINTENTOS_IMAGEN + 1):
+            async with semaforo:
+                inicio = await control.adquirir_async()
+                limites = LIMITES
+                pausas = []
+                try:
+                    await limites.adquirir_conexion_async()
+                except BaseException:
+                    control.liberar(inicio, exito=None)
+                    raise
+                inicio = time.perf_counter()
+                try:
+                    estado = await _pedir_imagen_async(client, ctx, img_url, ext, chapter_folder, idx,
+                                                       dest_filename, short_img_url, pausas)
+                except ErrorReintentable as e:
+                    control.liberar(inicio + sum(pausas), exito=False)
+                    error = e
+                except BaseException:
+                    control.liberar(inicio, exito=None)
+                    raise
+                else:
+                    control.liberar(inicio + sum(pausas), exito=True)
+                    return estado
+                finally:
+                    limites.conexiones.release()
+            espera = _siguiente_reintento(ctx, error, intento, short_img_url)
+            if espera is None:
+                return
+            await asyncio.sleep(espera)
+    except Exception as e:
+        append_log(f"[DESCARGAR] Error descargando {short_img_url}: {e}")
+
+
+async def _pedir_imagen_async(client, ctx, img_url, ext, chapter_folder, idx, dest_filename, short_img_url, pausas):
+    """
+    Un intento de descarga con httpx. Lanza ErrorReintentable si el fallo es
+    transitorio. El cuerpo se junta en memoria y se escribe en la caché desde
+    un hilo al terminar (no hay más imágenes en memoria que peticiones en curso).
+    """
+    import asyncio
+    import httpx
+
+    try:
+        if ctx.comprobar_con_head:
+            try:
+                ctx.estadisticas.sumar(chapter_folder, peticiones=1)
+                with ctx.metricas.medir("http_head_segundos"):
+                    head_resp = await client.head(img_url, follow_redirects=True)
+                if _es_pequena(ctx, head_resp.status_code, head_resp.headers, short_img_url):
+                    return "omitida"
+            except Exception as e:
+                append_log(f"[DESCARGAR] HEAD error con {short_img_url}: {e}")
+
+        ctx.estadisticas.sumar(chapter_folder, peticiones=1)
+        inicio = time.perf_counter()
+        async with client.stream("GET", img_url, follow_redirects=True) as resp:
+            ctx.metricas.observar("http_respuesta_segundos", time.perf_counter() - inicio)
+            if resp.status_code in ESTADOS_REINTENTABLES:
+                ctx.metricas.sumar("http_errores")
+                raise ErrorReintentable(f"Error {resp.status_code}", _retry_after(resp.headers))
+            if resp.status_code != 200:
+                ctx.metricas.sumar("http_errores")
+                append_log(f"[DESCARGAR] Error {resp.status_code} descargando {short_img_url}")
+                return
+            if _es_pequena(ctx, resp.status_code, resp.headers, short_img_url):
+                return "omitida"
+            partes = []
+            async for chunk in resp.aiter_bytes(TAMANIO_BLOQUE):
+                partes.append(chunk)
+                ctx.estadisticas.sumar(chapter_folder, bytes_recibidos=len(chunk))
+                espera = LIMITES.ancho_banda.reservar(len(chunk))
+                if espera:
+                    pausas.append(espera)
+                    await asyncio.sleep(espera)
+            ctx.metricas.observar("http_get_segundos", time.perf_counter() - inicio)
+    except httpx.TransportError as e:
+        ctx.metricas.sumar("http_errores")
+        raise ErrorReintentable(type(e).__name__) from e
+    return await _en_hilo(_guardar_partes, ctx, img_url, ext, partes, chapter_folder, idx, dest_filename)
+
+
+def _guardar_partes(ctx, img_url, ext, partes, chapter_folder, idx, dest_filename):
+    """Motor async: escribe en la caché los bloques recibidos y sigue como _guardar_en_capitulo."""
+    temporal = ctx.almacen.nueva_descarga()
+    try:
+        for parte in partes:
+            temporal.escribir(parte)
+    except BaseException:
+        temporal.descartar()
+        raise
+    return _guardar_en_capitulo(ctx, img_url, ext, temporal, chapter_folder, idx, dest_filename)
+
+
+def _get_next_chapter_link(page):
+    """
+    Devuelve la URL completa del siguiente capítulo, o None si no lo encuentra.
+    (Se asume que la URL completa sí debe ser visible).
+    """
+    try:
+        next_link = page.wait_for_selector("a:has(i[class*='chevron-right'])", timeout=5000)
+        if next_link:
+            href = next_link.get_attribute("href")
+            if href:
+                return urllib.parse.urljoin(page.url, href)
+    except Exception as e:
+        append_log(f"[DESCARGAR] Error obteniendo link del siguiente capítulo: {e}")
+    return None
+
+
+def eliminar_duplicados_img(serie_name, perceptual=False, umbral=UMBRAL_PERCEPTUAL):
+    """
+    Elimina imágenes duplicadas en Nombre_de_la_serie/Capitulos_Carpetas.
+    Solo se leen los archivos que comparten tamaño con otro: primero se compara
+    un hash de los primeros bytes y, si coincide, el hash completo. Los hashes
+    se calculan en paralelo y se guardan en un índice para la próxima vez.
+    Con 'perceptual' también elimina las casi duplicadas (p. ej. créditos
+    recodificados): imágenes con dHash/pHash a distancia <= 'umbral' que se
+    repiten en más de un capítulo. Requiere Pillow y numpy.
+    Devuelve False si no hay carpeta de capítulos o algo falló (ver el log).
+    """
+    append_log(f"[DUPLICADOS] Serie: {serie_name}. Buscando duplicados...")
+
+    serie_dir = os.path.join(os.getcwd(), serie_name)
+    capitulos_dir = os.path.join(serie_dir, "Capitulos_Carpetas")
+    if not os.path.isdir(capitulos_dir):
+        append_log("[DUPLICADOS] No existe la carpeta de capítulos. Cancelando.")
+        return False
+
+    errores = 0
+    # (ruta, tamaño, mtime) de cada imagen
+    archivos = []
+    for root, dirs, files in os.walk(capitulos_dir):
+        if "cache_images" in dirs:
+            dirs.remove("cache_images")
+        if CARPETA_PROCESANDO in dirs:
+            dirs.remove(CARPETA_PROCESANDO)
+        for file in files:
+            ext = os.path.splitext(file)[1].lower()
+            if ext in EXT_VALIDAS:
+                ruta_completa = os.path.join(root, file)
+                try:
+                    st = os.stat(ruta_completa)
+                except OSError as e:
+                    append_log(f"[DUPLICADOS] Error en {shorten_path(ruta_completa, serie_dir)}: {e}")
+                    errores += 1
+                    continue
+                archivos.append((ruta_completa, st.st_size, st.st_mtime_ns))
+
+    indice = IndiceHashes(serie_dir)
+    try:
+        indice.olvidar_faltantes(r for r, _, _ in archivos)
+        leidos = 0
+
+        def agrupar(grupos_previos, tipo):
+            """Subdivide cada grupo por el hash 'tipo' (del índice o calculado en paralelo)."""
+            nonlocal leidos, errores
+            limite = BYTES_HASH_PARCIAL if tipo == "parcial" else None
+            candidatos = [a for grupo in grupos_previos for a in grupo]
+            hashes = {}
+            por_calcular = []
+            for ruta, tamanio, mtime in candidatos:
+                hval = indice.obtener(ruta, tamanio, mtime, tipo)
+                if hval:
+                    hashes[ruta] = hval
+                else:
+                    por_calcular.append((ruta, tamanio, mtime))
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=HILOS_HASH) as executor:
+                futures = {executor.submit(_hash_archivo, ruta, limite): (ruta, tamanio, mtime)
+                           for ruta, tamanio, mtime in por_calcular}
+                for future in concurrent.futures.as_completed(futures):
+                    ruta, tamanio, mtime = futures[future]
+                    try:
+                        hashes[ruta] = future.result()
+                    except Exception as e:
+                        append_log(f"[DUPLICADOS] Error en {shorten_path(ruta, serie_dir)}: {e}")
+                        errores += 1
+                        continue
+                    leidos += 1
+                    if tipo == "parcial" and tamanio <= BYTES_HASH_PARCIAL:
+                        # Archivo pequeño: el hash parcial ya es el completo
+                        indice.guardar(ruta, tamanio, mtime, parcial=hashes[ruta], completo=hashes[ruta])
+                    elif tipo == "parcial":
+                        indice.guardar(ruta, tamanio, mtime, parcial=hashes[ruta])
+                    else:
+                        indice.guardar(ruta, tamanio, mtime, completo=hashes[ruta])
+
+            nuevos = []
+            for grupo in grupos_previos:
+                subgrupos = {}
+                for archivo in grupo:
+                    if archivo[0] in hashes:
+                        subgrupos.setdefault(hashes[archivo[0]], []).append(archivo)
+                nuevos.extend(g for g in subgrupos.values() if len(g) > 1)
+            return nuevos
+
+        # 1) Agrupar por tamaño: un archivo de tamaño único no puede estar duplicado
+        por_tamanio = {}
+        for archivo in archivos:
+            por_tamanio.setdefault(archivo[1], []).append(archivo)
+        grupos = [g for g in por_tamanio.values() if len(g) > 1]
+
+        # 2) Hash de los primeros bytes y 3) hash completo, solo donde sigue habiendo empate
+        grupos = agrupar(grupos, "parcial")
+        grupos = agrupar(grupos, "completo")
+        append_log(f"[DUPLICADOS] {len(archivos)} imágenes, {leidos} hashes calculados "
+                   f"(el resto por tamaño único o desde el índice).")
+        a_eliminar = [r for grupo in grupos for r, _, _ in grupo]
+
+        if perceptual:
+            try:
+                import numpy  # noqa: F401
+                import PIL  # noqa: F401
+            except ImportError:
+                append_log("[DUPLICADOS] El modo perceptual necesita Pillow y numpy: pip install Pillow numpy")
+            else:
+                exactas = set(a_eliminar)
+                restantes = [a for a in archivos if a[0] not in exactas]
+                for grupo in _grupos_casi_duplicados(restantes, indice, serie_dir, umbral):
+                    # Solo lo que se repite entre capítulos: evita borrar páginas
+                    # parecidas y seguidas de un mismo capítulo
+                    if len({os.path.dirname(r) for r in grupo}) > 1:
+                        a_eliminar.extend(grupo)
+    finally:
+        indice.cerrar()
+
+    # Eliminar duplicados (todas las copias)
+    for r in a_eliminar:
+        short_r = shorten_path(r, serie_dir)
+        try:
+            os.remove(r)
+            append_log(f"[DUPLICADOS] Eliminado duplicado: {short_r}")
+        except Exception as e:
+            append_log(f"[DUPLICADOS] Error al eliminar {short_r}: {e}")
+            errores += 1
+
+    append_log("[DUPLICADOS] Proceso finalizado.\n")
+    return errores == 0
+
+
+# Dentro de cada capítulo: páginas ya procesadas a la espera de sustituir a las originales
+CARPETA_PROCESANDO = ".procesando"
+# Parámetros con los que se procesó el capítulo (para no repetirlo)
+MARCA_PROCESADO = ".procesado"
+# Alto máximo que admite WebP
+MAX_ALTO_WEBP = 16383
+EXT_FORMATO = {"webp": ".webp", "jpeg": ".jpg", "png": ".png"}
+
+
+def procesar_imagenes(serie_name, formato=FORMATO_PROCESADO, calidad=CALIDAD_PROCESADO, alto_pagina=ALTO_PAGINA,
+                      progreso=None):
+    """
+    Paso opcional entre la descarga y el CBZ: recodifica las imágenes de cada
+    carpeta de Capitulos_Carpetas a 'formato'/'calidad' sin metadatos y, con
+    'alto_pagina', parte las tiras muy altas y junta los trozos muy bajos en
+    páginas de ese alto. Los capítulos se procesan a la vez en un pool de
+    procesos; los que el diario da por incompletos y los ya procesados con
+    los mismos parámetros se saltan. Requiere Pillow.
+    Devuelve False si no se pudo procesar algún capítulo (ver el log).
+    """
+    append_log(f"[PROCESAR] Serie: {serie_name} | Formato: {formato or 'original'} | Calidad: {calidad} | "
+               f"Alto de página: {alto_pagina or '-'}")
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        append_log("[PROCESAR] Se necesita Pillow: pip install Pillow")
+        return False
+
+    serie_dir = os.path.join(os.getcwd(), serie_name)
+    capitulos_dir = os.path.join(serie_dir, "Capitulos_Carpetas")
+    if not os.path.isdir(capitulos_dir):
+        append_log("[PROCESAR] No existe carpeta de capítulos. Cancelando.\n")
+        return False
+
+    incompletas = set()
+    if os.path.exists(os.path.join(serie_dir, DiarioDescargas.NOMBRE)):
+        diario = DiarioDescargas(serie_dir)
+        incompletas = diario.carpetas_incompletas()
+        diario.cerrar()
+
+    parametros = {"formato": formato, "calidad": calidad, "alto_pagina": alto_pagina}
+    inicio = time.monotonic()
+    sin_cambios = errores = 0
+    totales = [0, 0, 0, 0]  # imágenes antes, páginas después, bytes antes, bytes después
+    with concurrent.futures.ProcessPoolExecutor(max_workers=PROCESOS_IMAGENES) as pool:
+        futures = {}
+        for entry in sorted(os.scandir(capitulos_dir), key=lambda e: e.name):
+            if not entry.is_dir():
+                continue
+            if os.path.normpath(entry.path) in incompletas:
+                append_log(f"[PROCESAR] Carpeta '{entry.name}' con imágenes pendientes de descargar. Se omite.")
+                continue
+            if os.path.isfile(os.path.join(entry.path, CARPETA_PROCESANDO, MARCA_PROCESADO)):
+                # Se cortó al sustituir las páginas: ya están todas hechas, solo falta terminar
+                _sustituir_paginas(entry.path)
+                append_log(f"[PROCESAR] Carpeta '{entry.name}': terminado un procesado interrumpido.")
+            if (_marca_procesado(entry.path) or {}).get("parametros") == parametros:
+                sin_cambios += 1
+                continue
+            archivos = sorted(f for f in os.listdir(entry.path) if os.path.splitext(f)[1].lower() in EXT_VALIDAS)
+            if not archivos:
+                continue
+            future = pool.submit(_procesar_capitulo, entry.path, archivos, parametros)
+            futures[future] = entry.name
+
+        for hechos, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+            nombre_chapter = futures[future]
+            try:
+                resultado = future.result()
+            except Exception as e:
+                append_log(f"[PROCESAR] Error en carpeta '{nombre_chapter}': {e}")
+                errores += 1
+            else:
+                totales = [t + r for t, r in zip(totales, resultado)]
+                append_log(f"[PROCESAR]  -> OK: carpeta '{nombre_chapter}': {resultado[0]} imágenes -> "
+                           f"{resultado[1]} páginas, {resultado[2] / 1024:.0f} -> {resultado[3] / 1024:.0f} KiB")
+            if progreso:
+                progreso(f"{hechos}/{len(futures)} capítulos")
+
+    append_log(f"[PROCESAR] Procesado finalizado: {len(futures)} capítulos ({totales[0]} imágenes -> "
+               f"{totales[1]} páginas, {totales[2] / (1024 * 1024):.1f} -> {totales[3] / (1024 * 1024):.1f} MiB), "
+               f"{sin_cambios} sin cambios, en {time.monotonic() - inicio:.1f} s.\n")
+    return errores == 0
+
+
+def _marca_procesado(carpeta):
+    """Contenido de la marca de 'carpeta' ({"parametros", "paginas"}), o None si no tiene."""
+    try:
+        with open(os.path.join(carpeta, MARCA_PROCESADO), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _procesar_capitulo(carpeta, archivos, parametros):
+    """
+    Procesa las imágenes 'archivos' de 'carpeta', en orden de lectura. Se
+    ejecuta en un proceso del pool. Las páginas nuevas se escriben en
+    CARPETA_PROCESANDO y solo cuando están todas sustituyen a las originales.
+    Las originales son enlaces a la caché, así que se borran, nunca se
+    sobrescriben. Devuelve (imágenes, páginas, bytes antes, bytes después).
+    """
+    from PIL import Image
+
+    formato, calidad, alto_pagina = parametros["formato"], parametros["calidad"], parametros["alto_pagina"]
+    temporal = os.path.join(carpeta, CARPETA_PROCESANDO)
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+    paginas = []
+    bytes_antes = bytes_despues = 0
+
+    def escribir(img, ext):
+        nonlocal bytes_despues
+        nombre = f"imagen_{len(paginas) + 1:03d}{ext}"
+        _guardar_pagina(img, os.path.join(temporal, nombre), calidad)
+        paginas.append(nombre)
+        bytes_despues += os.path.getsize(os.path.join(temporal, nombre))
+
+    try:
+        acumulada = None  # (imagen, ext) de un trozo bajo que se puede juntar con el siguiente
+        for archivo in archivos:
+            ruta = os.path.join(carpeta, archivo)
+            bytes_antes += os.path.getsize(ruta)
+            ext = EXT_FORMATO.get(formato) or os.path.splitext(archivo)[1].lower()
+            with Image.open(ruta) as original:
+                img = _modo_salida(original, ext)
+            for pieza in _partir_tira(img, alto_pagina, ext):
+                # Solo se juntan trozos del mismo formato: con formato "original" un
+                # JPEG pegado a un PNG acabaría recodificado como PNG
+                if acumulada and acumulada[1] == ext and acumulada[0].width == pieza.width and \
+                        acumulada[0].height + pieza.height <= alto_pagina:
+                    pieza = _apilar(acumulada[0], pieza)
+                elif acumulada:
+                    escribir(*acumulada)
+                acumulada = None
+                if alto_pagina and pieza.height < alto_pagina / 2:
+                    acumulada = (pieza, ext)
+                else:
+                    escribir(pieza, ext)
+        if acumulada:
+            escribir(*acumulada)
+        # La marca (última en escribirse) indica que las páginas están completas
+        with open(os.path.join(temporal, MARCA_PROCESADO), "w", encoding="utf-8") as f:
+            json.dump({"parametros": parametros, "paginas": paginas}, f)
+    except BaseException:
+        shutil.rmtree(temporal, ignore_errors=True)
+        raise
+    _sustituir_paginas(carpeta)
+    return len(archivos), len(paginas), bytes_antes, bytes_despues
+
+
+def _modo_salida(img, ext):
+    """Copia de 'img' en un modo que admita el formato de 'ext' (JPEG no tiene transparencia)."""
+    con_alfa = "A" in img.getbands() or "transparency" in img.info
+    if ext in (".jpg", ".jpeg"):
+        return img.convert("L" if img.mode == "L" else "RGB")
+    if img.mode in ("L", "RGB", "RGBA"):
+        return img.copy()
+    return img.convert("RGBA" if con_alfa else "RGB")
+
+
+def _partir_tira(img, alto_pagina, ext):
+    """Parte 'img' en trozos iguales de unos 'alto_pagina' px si es más alta que 1,5 páginas (o que el máximo de WebP)."""
+    objetivo = None
+    if alto_pagina and img.height > alto_pagina * 1.5:
+        objetivo = alto_pagina
+    elif ext == ".webp" and img.height > MAX_ALTO_WEBP:
+        objetivo = MAX_ALTO_WEBP
+    if objetivo is None:
+        return [img]
+    alto = math.ceil(img.height / math.ceil(img.height / objetivo))
+    return [img.crop((0, y, img.width, min(img.height, y + alto))) for y in range(0, img.height, alto)]
+
+
+def _apilar(arriba, abajo):
+    """Une dos imágenes del mismo ancho, una encima de otra."""
+    from PIL import Image
+
+    modo = arriba.mode if arriba.mode == abajo.mode else "RGB"
+    resultado = Image.new(modo, (arriba.width, arriba.height + abajo.height))
+    resultado.paste(arriba.convert(modo), (0, 0))
+    resultado.paste(abajo.convert(modo), (0, arriba.height))
+    return resultado
+
+
+def _guardar_pagina(img, ruta, calidad):
+    """Guarda 'img' en el formato de la extensión de 'ruta', sin EXIF ni perfil ICC."""
+    ext = os.path.splitext(ruta)[1].lower()
+    opciones = {
+        ".webp": {"format": "WEBP", "quality": calidad, "method": 4},
+        ".jpg": {"format": "JPEG", "quality": calidad, "optimize": True, "progressive": True},
+        ".jpeg": {"format": "JPEG", "quality": calidad, "optimize": True, "progressive": True},
+        ".png": {"format": "PNG", "optimize": True},
+    }.get(ext, {})
+    if ext in (".jpg", ".jpeg") and img.mode not in ("L", "RGB"):
+        img = img.convert("RGB")
+    # Sin estas opciones Pillow copia el EXIF y el ICC de img.info: solo se deja la transparencia
+    img.info = {clave: valor for clave, valor in img.info.items() if clave == "transparency"}
+    img.save(ruta, exif=b"", icc_profile=None, **opciones)
+
+
+def _sustituir_paginas(carpeta):
+    """
+    Cambia las imágenes de 'carpeta' por las páginas completas de
+    CARPETA_PROCESANDO: borra las originales que no se van a reemplazar,
+    mueve las páginas (os.replace cambia la entrada del directorio, no el
+    archivo enlazado de la caché) y por último la marca. Si se corta a
+    medias se puede volver a llamar: las páginas ya movidas están en la marca.
+    """
+    temporal = os.path.join(carpeta, CARPETA_PROCESANDO)
+    paginas = _marca_procesado(temporal)["paginas"]
+    nuevas = set(paginas)
+    for nombre in os.listdir(carpeta):
+        if os.path.splitext(nombre)[1].lower() in EXT_VALIDAS and nombre not in nuevas:
+            os.remove(os.path.join(carpeta, nombre))
+    for nombre in paginas:
+        if os.path.exists(os.path.join(temporal, nombre)):
+            os.replace(os.path.join(temporal, nombre), os.path.join(carpeta, nombre))
+    os.replace(os.path.join(temporal, MARCA_PROCESADO), os.path.join(carpeta, MARCA_PROCESADO))
+    os.rmdir(temporal)
+
+
+def _crear_pool_cbz():
+    """
+    Pool de procesos para empaquetar capítulos en paralelo. Este módulo no
+    tiene interfaz, así que los hijos pueden importarlo con cualquier método
+    de arranque (fork, spawn) sin abrir ventanas.
+    """
+    return concurrent.futures.ProcessPoolExecutor(max_workers=PROCESOS_CBZ)
+
+
+def _empaquetar_capitulo(carpeta, archivos, output_cbz):
+    """
+    Crea 'output_cbz' con 'archivos' de 'carpeta'. Cada formato usa su
+    compresión de COMPRESION_CBZ (STORED para los ya comprimidos) y el
+    contenido se copia en bloques grandes. Se ejecuta en un proceso del pool.
+    Se escribe en un temporal y se renombra al final, así nunca queda un CBZ
+    a medias. Devuelve el SHA-256 del CBZ.
+    """
+    temporal = output_cbz + ".tmp"
+    try:
+        with zipfile.ZipFile(temporal, 'w') as zipf:
+            for archivo in archivos:
+                ruta_abs = os.path.join(carpeta, archivo)
+                zinfo = zipfile.ZipInfo.from_file(ruta_abs, arcname=archivo)
+                zinfo.compress_type = COMPRESION_CBZ.get(os.path.splitext(archivo)[1].lower(), zipfile.ZIP_DEFLATED)
+                with open(ruta_abs, "rb") as src, zipf.open(zinfo, "w") as dst:
+                    shutil.copyfileobj(src, dst, BLOQUE_CBZ)
+        sha = _hash_archivo(temporal)
+        os.replace(temporal, output_cbz)
+        return sha
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+
+class ManifiestoCBZ:
+    """
+    Manifiesto (Nombre_de_la_serie/comics_archivos/manifiesto_cbz.sqlite) de los
+    CBZ ya generados: por carpeta de capítulo, la huella de su contenido
+    (nombres, tamaños y mtimes) y el CBZ resultante con su tamaño, mtime y
+    SHA-256. Si nada cambió, el capítulo no se vuelve a empaquetar.
+    """
+
+    NOMBRE = "manifiesto_cbz.sqlite"
+
+    def __init__(self, comics_dir):
+        self._db = _abrir_sqlite(os.path.join(comics_dir, self.NOMBRE))
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cbz ("
+                " carpeta TEXT PRIMARY KEY, huella TEXT NOT NULL, cbz TEXT NOT NULL,"
+                " tamanio INTEGER NOT NULL, mtime INTEGER NOT NULL, sha256 TEXT NOT NULL)"
+            )
+
+    @staticmethod
+    def huella(carpeta, archivos):
+        """Huella del contenido de la carpeta a partir de nombre, tamaño y mtime de cada archivo."""
+        sha = hashlib.sha256()
+        for archivo in archivos:
+            st = os.stat(os.path.join(carpeta, archivo))
+            sha.update(f"{archivo}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+        return sha.hexdigest()
+
+    def al_dia(self, carpeta, huella, output_cbz):
+        """True si el CBZ de 'carpeta' ya se generó con esta huella y sigue intacto en disco."""
+        fila = self._db.execute(
+            "SELECT huella, cbz, tamanio, mtime FROM cbz WHERE carpeta = ?", (carpeta,)
+        ).fetchone()
+        if not fila or fila[0] != huella or fila[1] != os.path.basename(output_cbz):
+            return False
+        try:
+            st = os.stat(output_cbz)
+        except OSError:
+            return False
+        return st.st_size == fila[2] and st.st_mtime_ns == fila[3]
+
+    def registrar(self, carpeta, huella, output_cbz, sha):
+        st = os.stat(output_cbz)
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cbz (carpeta, huella, cbz, tamanio, mtime, sha256) VALUES (?, ?, ?, ?, ?, ?)",
+                (carpeta, huella, os.path.basename(output_cbz), st.st_size, st.st_mtime_ns, sha)
+            )
+
+    def olvidar_todo(self):
+        with self._db:
+            self._db.execute("DELETE FROM cbz")
+
+    def cerrar(self):
+        self._db.close()
+
+
+def convertir_folder_a_cbz(serie_name, prefix, progreso=None):
+    """
+    Convierte cada subcarpeta de Nombre_de_la_serie/Capitulos_Carpetas
+    en un archivo .cbz en Nombre_de_la_serie/comics_archivos/.
+    Los capítulos se empaquetan a la vez en un pool de procesos.
+    'progreso' (opcional) recibe el avance como texto.
+    Devuelve False si no hay carpeta de capítulos o falló algún CBZ.
+    """
+    append_log(f"[CBZ] Serie: {serie_name} | Prefijo: {prefix}")
+
+    serie_dir = os.path.join(os.getcwd(), serie_name)
+    capitulos_dir = os.path.join(serie_dir, "Capitulos_Carpetas")
+    comics_dir = os.path.join(serie_dir, "comics_archivos")
+
+    if not os.path.isdir(capitulos_dir):
+        append_log("[CBZ] No existe carpeta de capítulos. Cancelando.\n")
+        return False
+
+    os.makedirs(comics_dir, exist_ok=True)
+    manifiesto = ManifiestoCBZ(comics_dir)
+
+    inicio = time.monotonic()
+    sin_cambios = errores = 0
+    with _crear_pool_cbz() as pool:
+        futures = {}
+        for entry in os.scandir(capitulos_dir):
+            if entry.is_dir():
+                nombre_chapter = entry.name  # ej: "10"
+                output_cbz = os.path.join(comics_dir, f"{prefix} {nombre_chapter}.cbz")
+
+                archivos = sorted(
+                    f for f in os.listdir(entry.path)
+                    if os.path.splitext(f)[1].lower() in EXT_VALIDAS
+                )
+                if not archivos:
+                    append_log(f"[CBZ] Carpeta '{nombre_chapter}' sin imágenes válidas. Se omite.")
+                    continue
+
+                huella = ManifiestoCBZ.huella(entry.path, archivos)
+                if manifiesto.al_dia(entry.name, huella, output_cbz):
+                    sin_cambios += 1
+                    continue
+
+                append_log(f"[CBZ] Creando: {shorten_path(output_cbz, serie_dir)} (desde carpeta '{nombre_chapter}')")
+                future = pool.submit(_empaquetar_capitulo, entry.path, archivos, output_cbz)
+                futures[future] = (nombre_chapter, output_cbz, huella)
+
+        for hechos, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+            nombre_chapter, output_cbz, huella = futures[future]
+            try:
+                manifiesto.registrar(nombre_chapter, huella, output_cbz, future.result())
+                append_log(f"[CBZ]  -> OK: carpeta '{nombre_chapter}' empaquetada.")
+            except Exception as e:
+                append_log(f"[CBZ] Error creando {shorten_path(output_cbz, serie_dir)}: {e}")
+                errores += 1
+            if progreso:
+                progreso(f"{hechos}/{len(futures)} CBZ")
+
+    manifiesto.cerrar()
+    append_log(f"[CBZ] Conversión finalizada: {len(futures)} capítulos empaquetados, "
+               f"{sin_cambios} sin cambios, en {time.monotonic() - inicio:.1f} s.\n")
+    return errores == 0
+
+
+def eliminar_archivos_al_finalizar(serie_name):
+    """
+    Elimina:
+      - TODAS las subcarpetas de Capitulos_Carpetas
+      - TODOS los archivos .cbz en comics_archivos
+      - Los capítulos del diario de descargas y del manifiesto CBZ
+      - (Opcional) la carpeta cache_images
+    Devuelve False si algo no se pudo borrar.
+    """
+    append_log(f"[ELIMINAR] Serie: {serie_name}. Borrando carpetas y CBZ...")
+
+    serie_dir = os.path.join(os.getcwd(), serie_name)
+    capitulos_dir = os.path.join(serie_dir, "Capitulos_Carpetas")
+    comics_dir = os.path.join(serie_dir, "comics_archivos")
+    errores = 0
+
+    # 1) Borrar subcarpetas en Capitulos_Carpetas
+    if os.path.isdir(capitulos_dir):
+        for entry in os.scandir(capitulos_dir):
+            if entry.is_dir():
+                short_p = shorten_path(entry.path, serie_dir)
+                try:
+                    shutil.rmtree(entry.path)
+                    append_log(f"[ELIMINAR] Borrada carpeta: {short_p}")
+                except Exception as e:
+                    append_log(f"[ELIMINAR] Error al borrar {short_p}: {e}")
+                    errores += 1
+
+    # 2) Borrar .cbz en comics_archivos
+    if os.path.isdir(comics_dir):
+        for entry in os.scandir(comics_dir):
+            if entry.is_file() and entry.name.lower().endswith(".cbz"):
+                short_f = shorten_path(entry.path, serie_dir)
+                try:
+                    os.remove(entry.path)
+                    append_log(f"[ELIMINAR] Borrado archivo: {short_f}")
+                except Exception as e:
+                    append_log(f"[ELIMINAR] Error al borrar {short_f}: {e}")
+                    errores += 1
+
+    # 3) Olvidar los capítulos del diario y del manifiesto CBZ: ya no existen
+    if os.path.exists(os.path.join(comics_dir, ManifiestoCBZ.NOMBRE)):
+        manifiesto = ManifiestoCBZ(comics_dir)
+        manifiesto.olvidar_todo()
+        manifiesto.cerrar()
+
+    if os.path.exists(os.path.join(serie_dir, DiarioDescargas.NOMBRE)):
+        diario = DiarioDescargas(serie_dir)
+        diario.borrar_capitulos()
+        diario.cerrar()
+        append_log("[ELIMINAR] Diario de descargas reiniciado.")
+
+    # 4) (Opcional) borrar carpeta cache_images si se desea
+    # cache_path = os.path.join(serie_dir, "cache_images")
+    # if os.path.isdir(cache_path):
+    #     short_c = shorten_path(cache_path, serie_dir)
+    #     try:
+    #         shutil.rmtree(cache_path)
+    #         append_log(f"[ELIMINAR] Borrada carpeta caché: {short_c}")
+    #     except Exception as e:
+    #         append_log(f"[ELIMINAR] Error al borrar {short_c}: {e}")
+
+    append_log("[ELIMINAR] Proceso completado.\n")
+    return errores == 0
+
+
@@ -0,0 +1,5 @@
+# Los módulos del programa están en codigo/ y se importan sin paquete (import nucleo)
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "codigo"))
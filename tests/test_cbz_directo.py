@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+import zipfile
+
+import nucleo
+
+
+class PruebaCBZDirecto(unittest.TestCase):
+
+    def setUp(self):
+        nucleo.fijar_log(lambda texto: None)
+        self.addCleanup(nucleo.fijar_log, nucleo._log_consola)
+        self.serie_dir = tempfile.mkdtemp()
+        self.diario = nucleo.DiarioDescargas(self.serie_dir)
+        self.addCleanup(self.diario.cerrar)
+
+    def imagen_en_cache(self, sha):
+        ruta = os.path.join(self.serie_dir, f"{sha}.webp")
+        with open(ruta, "wb") as f:
+            f.write(sha.encode() * 100)
+        return ruta
+
+    def escribir_capitulo(self, numero, hashes):
+        output_cbz = os.path.join(self.serie_dir, f"Serie {numero}.cbz")
+        escritor = nucleo.EscritorCBZ(output_cbz, range(1, len(hashes) + 1), self.diario)
+        for idx, sha in enumerate(hashes, start=1):
+            escritor.colocar(idx, self.imagen_en_cache(sha), f"imagen_{idx:03d}.webp")
+            escritor.terminada(idx)
+        return output_cbz
+
+    def paginas(self, output_cbz):
+        with zipfile.ZipFile(output_cbz) as z:
+            return [(n, z.read(n)[:6]) for n in z.namelist()]
+
+    def comprobar_orden(self, orden):
+        capitulos = {1: ["creditos", "pagina1"], 2: ["pagina2", "creditos"]}
+        cbz = {numero: self.escribir_capitulo(numero, capitulos[numero]) for numero in orden}
+        nucleo._quitar_paginas_repetidas(self.diario, self.serie_dir)
+
+        self.assertEqual(self.paginas(cbz[1]), [("imagen_002.webp", b"pagina")])
+        self.assertEqual(self.paginas(cbz[2]), [("imagen_001.webp", b"pagina")])
+        self.assertEqual(self.diario.paginas_repetidas(), [])
+
+    def test_pagina_repetida_se_quita_de_todos_los_capitulos(self):
+        self.comprobar_orden([1, 2])
+
+    def test_el_resultado_no_depende_de_que_capitulo_termina_antes(self):
+        self.comprobar_orden([2, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
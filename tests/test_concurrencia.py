@@ -0,0 +1,42 @@
+import asyncio
+import threading
+import unittest
+
+import nucleo
+
+
+class PruebaEsperaAsync(unittest.TestCase):
+
+    def esperar_en_bucle(self, corrutina, liberar):
+        """Corre 'corrutina' y llama a 'liberar' desde otro hilo cuando ya está esperando."""
+        async def principal():
+            tarea = asyncio.ensure_future(corrutina)
+            await asyncio.sleep(0.05)
+            self.assertFalse(tarea.done())
+            threading.Thread(target=liberar).start()
+            return await asyncio.wait_for(tarea, 5)
+
+        return asyncio.run(principal())
+
+    def test_control_despierta_la_corrutina_al_liberar(self):
+        control = nucleo.ControlConcurrencia(inicial=2, minimo=2, maximo=2)
+        inicio = control.adquirir()
+        control.adquirir()
+
+        self.esperar_en_bucle(control.adquirir_async(), lambda: control.liberar(inicio, None))
+
+        self.assertIsNone(control.intentar_adquirir())
+
+    def test_semaforo_compartido_entre_hilos_y_corrutinas(self):
+        semaforo = nucleo.SemaforoCompartido(1)
+        semaforo.acquire()
+
+        self.esperar_en_bucle(semaforo.adquirir_async(), semaforo.release)
+
+        semaforo.release()
+        with semaforo:
+            pass
+
+
+if __name__ == "__main__":
+    unittest.main()
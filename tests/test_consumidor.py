@@ -0,0 +1,82 @@
+import concurrent.futures
+import os
+import queue
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import nucleo
+
+
+class MotorLento:
+    """Motor de pruebas: da cada imagen por descargada al cabo de un momento, sin red."""
+
+    def __init__(self):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+
+    def enviar(self, ctx, img_url, chapter_folder, idx, page_url):
+        return self._executor.submit(lambda: time.sleep(0.02) or "ok")
+
+    def cerrar(self):
+        self._executor.shutdown(wait=True)
+
+
+class PruebaConsumidor(unittest.TestCase):
+
+    def setUp(self):
+        nucleo.fijar_log(lambda texto: None)
+        self.addCleanup(nucleo.fijar_log, nucleo._log_consola)
+        serie_dir = tempfile.mkdtemp()
+        cache_dir = os.path.join(serie_dir, "cache_images")
+        os.makedirs(cache_dir)
+        self.ctx = nucleo.ContextoDescarga(serie_dir, cache_dir)
+        self.addCleanup(self.ctx.cerrar)
+        self.motor = MotorLento()
+        self.addCleanup(self.motor.cerrar)
+
+    def consumir(self, cola):
+        hilo = threading.Thread(target=nucleo._consumir_capitulos, args=(cola, self.ctx, self.motor), daemon=True)
+        hilo.start()
+        return hilo
+
+    def test_dos_capitulos_con_la_misma_carpeta_terminan_los_dos(self):
+        carpeta = os.path.join(self.ctx.serie_dir, "Capitulos_Carpetas", "10")
+        os.makedirs(carpeta)
+        cola = queue.Queue()
+        for url in ("https://ejemplo.com/a", "https://ejemplo.com/b"):
+            imagenes = [f"{url}/{i}.webp" for i in range(1, 6)]
+            self.ctx.diario.registrar_capitulo(url, "10", carpeta, imagenes)
+            cola.put((url, carpeta, list(enumerate(imagenes, start=1)), url))
+        cola.put(None)
+
+        self.consumir(cola).join(10)
+
+        self.assertEqual(self.ctx.diario.imagenes_pendientes("https://ejemplo.com/a"), [])
+        self.assertEqual(self.ctx.diario.imagenes_pendientes("https://ejemplo.com/b"), [])
+
+    def test_si_el_consumidor_falla_el_productor_no_se_bloquea(self):
+        self.ctx.salida = "cbz"
+        cola = queue.Queue(maxsize=1)
+
+        def producir():
+            for numero in range(10):
+                cola.put((f"https://ejemplo.com/{numero}", f"{numero}.cbz", [(1, "https://ejemplo.com/1.webp")],
+                          f"https://ejemplo.com/{numero}"))
+            cola.put(None)
+
+        productor = threading.Thread(target=producir, daemon=True)
+        with mock.patch.object(nucleo, "EscritorCBZ", side_effect=OSError("disco lleno")):
+            productor.start()
+            consumidor = self.consumir(cola)
+            productor.join(10)
+            consumidor.join(10)
+
+        self.assertFalse(productor.is_alive())
+        self.assertFalse(consumidor.is_alive())
+        self.assertTrue(self.ctx.detenida.is_set())
+
+
+if __name__ == "__main__":
+    unittest.main()
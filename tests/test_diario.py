@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import nucleo
+
+
+class PruebaDiario(unittest.TestCase):
+
+    def setUp(self):
+        self.biblioteca = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.biblioteca, True)
+
+    def mover_serie(self, anterior):
+        """Registra en la serie 'anterior' un capítulo a medias y una página de CBZ, y mueve la serie."""
+        diario = nucleo.DiarioDescargas(anterior)
+        carpeta = os.path.join(anterior, "Capitulos_Carpetas", "1")
+        cbz = os.path.join(anterior, "comics_archivos", "P 1.cbz")
+        diario.registrar_capitulo("https://ejemplo.com/1", "1", carpeta, ["https://ejemplo.com/1.webp"])
+        diario.anotar_pagina("abc", cbz, "imagen_001.webp")
+        diario.anotar_pagina("abc", cbz, "imagen_002.webp")
+        diario.cerrar()
+
+        nueva = os.path.join(self.biblioteca, "B", "S")
+        shutil.move(os.path.dirname(anterior), os.path.dirname(nueva))
+        diario = nucleo.DiarioDescargas(nueva)
+        self.addCleanup(diario.cerrar)
+        return diario, nueva
+
+    def test_las_rutas_siguen_a_la_serie_movida(self):
+        anterior = os.path.join(self.biblioteca, "A", "S")
+        os.makedirs(anterior)
+
+        diario, nueva = self.mover_serie(anterior)
+
+        carpeta = os.path.join(nueva, "Capitulos_Carpetas", "1")
+        cbz = os.path.join(nueva, "comics_archivos", "P 1.cbz")
+        self.assertEqual(diario.capitulo("https://ejemplo.com/1")["carpeta"], carpeta)
+        self.assertEqual(diario.carpetas_incompletas(), {carpeta})
+        self.assertEqual(diario.paginas_repetidas(), [(cbz, "imagen_001.webp")])
+
+        diario.marcar_quitadas(cbz, ["imagen_001.webp"])
+        self.assertEqual(diario.paginas_repetidas(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import nucleo
+
+
+class PruebaDuplicados(unittest.TestCase):
+
+    def setUp(self):
+        nucleo.fijar_log(lambda texto: None)
+        self.addCleanup(nucleo.fijar_log, nucleo._log_consola)
+        directorio = tempfile.mkdtemp()
+        anterior = os.getcwd()
+        os.chdir(directorio)
+        self.addCleanup(os.chdir, anterior)
+        for capitulo in ("1", "2"):
+            carpeta = os.path.join("S", "Capitulos_Carpetas", capitulo)
+            os.makedirs(carpeta)
+            with open(os.path.join(carpeta, "imagen_001.webp"), "wb") as f:
+                f.write(b"creditos" * 100)
+
+    def test_elimina_todas_las_copias(self):
+        self.assertTrue(nucleo.eliminar_duplicados_img("S"))
+        for capitulo in ("1", "2"):
+            self.assertEqual(os.listdir(os.path.join("S", "Capitulos_Carpetas", capitulo)), [])
+
+    def test_cierra_el_indice_si_falla_el_hash(self):
+        cerrar = nucleo.IndiceHashes.cerrar
+        with mock.patch.object(nucleo.IndiceHashes, "cerrar", autospec=True, side_effect=cerrar) as cerrado, \
+                mock.patch.object(nucleo.IndiceHashes, "obtener", side_effect=RuntimeError("índice dañado")):
+            with self.assertRaises(RuntimeError):
+                nucleo.eliminar_duplicados_img("S")
+
+        cerrado.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
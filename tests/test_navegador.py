@@ -0,0 +1,71 @@
+import unittest
+from unittest import mock
+
+import nucleo
+
+try:
+    from playwright.sync_api import Error as PlaywrightError
+except ImportError:
+    PlaywrightError = None
+
+
+class RutaFalsa:
+    """Lo que usa _medir_imagen de un Route de Playwright."""
+
+    def __init__(self, cuerpo=b"x" * 1000, error=None):
+        self.cuerpo = cuerpo
+        self.error = error
+        self.request = mock.Mock()
+        self.entregada = self.abortada = False
+
+    def fetch(self):
+        if self.error:
+            raise self.error
+        return mock.Mock(body=lambda: self.cuerpo)
+
+    def fulfill(self, response, body):
+        self.entregada = body == self.cuerpo
+
+    def abort(self):
+        self.abortada = True
+
+
+@unittest.skipIf(PlaywrightError is None, "necesita playwright")
+class PruebaMedirImagen(unittest.TestCase):
+
+    def setUp(self):
+        self.navegador = nucleo.GestorNavegador(playwright=None)
+
+    def test_descuenta_el_ancho_de_banda_y_espera_sin_bloquear(self):
+        limites = nucleo.LimitesGlobales(bytes_por_segundo=1000)
+        limites.ancho_banda.reservar(1000)  # Sin ráfaga disponible
+        ruta = RutaFalsa()
+
+        self.navegador._medir_imagen(ruta, limites)
+
+        self.assertTrue(ruta.entregada)
+        espera_ms, = ruta.request.frame.page.wait_for_timeout.call_args.args
+        self.assertAlmostEqual(espera_ms, 1000, delta=50)
+        self.assertEqual(self.navegador.metricas.contadores["navegador_bytes_recibidos"], 1000)
+
+    def test_aborta_si_no_se_puede_pedir(self):
+        ruta = RutaFalsa(error=PlaywrightError("net::ERR_CONNECTION_RESET"))
+
+        self.navegador._medir_imagen(ruta, nucleo.LimitesGlobales(bytes_por_segundo=1000))
+
+        self.assertTrue(ruta.abortada)
+        self.assertFalse(ruta.entregada)
+
+
+class PruebaLimitesGlobales(unittest.TestCase):
+
+    def test_navegadores_y_motores_no_pasan_del_total(self):
+        for navegadores, conexiones in ((2, 32), (1, 8), (4, 10), (2, 3)):
+            limites = nucleo.LimitesGlobales(navegadores, conexiones)
+            self.assertLessEqual(navegadores * limites.conexiones_navegador + limites.conexiones_http, conexiones)
+            self.assertGreaterEqual(limites.conexiones_navegador, 1)
+            self.assertGreaterEqual(limites.conexiones_http, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import cli
+import nucleo
+
+
+class PruebaPlanificador(unittest.TestCase):
+
+    def setUp(self):
+        self.log = []
+        nucleo.fijar_log(self.log.append)
+        self.addCleanup(nucleo.fijar_log, nucleo._log_consola)
+
+    def test_trabajo_que_devuelve_false_omite_los_siguientes_de_su_serie(self):
+        hechos = []
+        planificador = nucleo.Planificador(2)
+        fallido, omitido, otra_serie = planificador.agregar_varios([
+            ("A", "Descargar", lambda progreso: False),
+            ("A", "Eliminar", lambda progreso: hechos.append("A")),
+            ("B", "Eliminar", lambda progreso: hechos.append("B")),
+        ])
+        planificador.esperar()
+
+        self.assertEqual(fallido.estado, "error")
+        self.assertEqual(omitido.estado, "omitido")
+        self.assertEqual(otra_serie.estado, "terminado")
+        self.assertEqual(hechos, ["B"])
+        self.assertEqual(planificador.series_con_errores(), ["A"])
+
+    def test_trabajo_que_lanza_omite_los_siguientes_de_su_serie(self):
+        def fallar(progreso):
+            raise RuntimeError("sin red")
+
+        planificador = nucleo.Planificador(1)
+        fallido, omitido = planificador.agregar_varios([
+            ("A", "Descargar", fallar),
+            ("A", "Convertir a CBZ", lambda progreso: True),
+        ])
+        planificador.esperar()
+
+        self.assertEqual((fallido.estado, omitido.estado), ("error", "omitido"))
+
+    def test_lote_no_elimina_tras_una_descarga_fallida(self):
+        directorio = tempfile.mkdtemp()
+        anterior = os.getcwd()
+        os.chdir(directorio)
+        self.addCleanup(os.chdir, anterior)
+        with open("trabajos.txt", "w", encoding="utf-8") as f:
+            f.write('descargar "Mi Serie" https://ejemplo.com/capitulo-1 --final abc\n')
+            f.write('eliminar "Mi Serie"\n')
+
+        with mock.patch.object(nucleo, "eliminar_archivos_al_finalizar") as eliminar:
+            fallidas = cli.ejecutar_lote("trabajos.txt")
+
+        self.assertEqual(fallidas, 1)
+        eliminar.assert_not_called()
+        self.assertIn("[DESCARGAR] Error: el capítulo final no es numérico.", self.log)
+
+
+if __name__ == "__main__":
+    unittest.main()
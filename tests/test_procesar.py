@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+import nucleo
+
+try:
+    from PIL import Image, ImageCms
+except ImportError:
+    Image = None
+
+
+@unittest.skipIf(Image is None, "necesita Pillow")
+class PruebaProcesar(unittest.TestCase):
+
+    def setUp(self):
+        self.carpeta = tempfile.mkdtemp()
+
+    def guardar(self, nombre, alto, **opciones):
+        Image.new("RGB", (100, alto), (200, 30, 30)).save(os.path.join(self.carpeta, nombre), **opciones)
+
+    def procesar(self, formato, alto_pagina=None):
+        archivos = sorted(os.listdir(self.carpeta))
+        parametros = {"formato": formato, "calidad": 85, "alto_pagina": alto_pagina}
+        nucleo._procesar_capitulo(self.carpeta, archivos, parametros)
+        return sorted(f for f in os.listdir(self.carpeta) if f != nucleo.MARCA_PROCESADO)
+
+    def test_png_sin_exif_ni_perfil_icc(self):
+        exif = Image.Exif()
+        exif[0x010F] = "Camara"
+        icc = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+        self.guardar("imagen_001.png", 300, exif=exif.tobytes(), icc_profile=icc)
+        with Image.open(os.path.join(self.carpeta, "imagen_001.png")) as original:
+            self.assertIn("icc_profile", original.info)
+
+        self.assertEqual(self.procesar("png"), ["imagen_001.png"])
+
+        with Image.open(os.path.join(self.carpeta, "imagen_001.png")) as procesada:
+            self.assertNotIn("icc_profile", procesada.info)
+            self.assertNotIn("exif", procesada.info)
+            self.assertEqual(len(procesada.getexif()), 0)
+
+    def test_formato_original_junta_trozos_jpeg_sin_cambiar_de_formato(self):
+        self.guardar("imagen_001.jpg", 300)
+        self.guardar("imagen_002.jpg", 400)
+
+        self.assertEqual(self.procesar(None, alto_pagina=2000), ["imagen_001.jpg"])
+        with Image.open(os.path.join(self.carpeta, "imagen_001.jpg")) as pagina:
+            self.assertEqual((pagina.format, pagina.height), ("JPEG", 700))
+
+    def test_formato_original_no_junta_formatos_distintos(self):
+        self.guardar("imagen_001.png", 300)
+        self.guardar("imagen_002.jpg", 400)
+
+        self.assertEqual(self.procesar(None, alto_pagina=2000), ["imagen_001.png", "imagen_002.jpg"])
+
+
+if __name__ == "__main__":
+    unittest.main()